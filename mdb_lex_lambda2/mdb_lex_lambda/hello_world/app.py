@@ -1,11 +1,17 @@
-from langchain_mongodb import build_chain, run_chain
+from deadline import Deadline
+from langchain_mongodb import get_chain, run_chain
+from resilience import breaker_metrics
+from retrieval_cache import get_retrieval_cache
+from session_context import SessionContext
+import json
 
 # import requests
 
-def lex_response(res):
+def lex_response(res, session_attributes=None):
     
     response = {
     'sessionState': {
+        'sessionAttributes': session_attributes or {},
         'dialogAction': {
             'type': 'Close'
         },
@@ -27,13 +33,21 @@ def lex_response(res):
 def lambda_handler(event, context):
     
     input_text = event['inputTranscript']
+    session_attributes = event.get('sessionState', {}).get('sessionAttributes') or {}
+    session = SessionContext.from_lex(session_attributes)
 
-    chain = build_chain()
-    result = run_chain(chain, input_text)
+    # Budget the request on the time Lambda has left before the function timeout
+    deadline = Deadline.from_context(context)
+
+    chain = get_chain()
+    result = run_chain(chain, input_text, deadline=deadline, session=session)
 
     print("Input text is:",input_text)
     print("LLM generated text is:",result['answer'])
+    print("Endpoint health:", json.dumps(breaker_metrics()))
+    print("Retrieval cache:", json.dumps(get_retrieval_cache().metrics()))
+    print("Session retrieval stats:", json.dumps(session.stats))
 
-    response = lex_response(result['answer'])
+    response = lex_response(result['answer'], session.to_lex(session_attributes))
     
     return response
@@ -0,0 +1,56 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Optional
+import time
+
+# Time kept back from the Lambda budget for building and returning the Lex response
+RESPONSE_RESERVE_MS = 500
+
+_current_deadline: ContextVar[Optional["Deadline"]] = ContextVar("deadline", default=None)
+
+
+class Deadline:
+    """Time budget for one request, measured against a monotonic clock"""
+
+    def __init__(self, budget_ms: float, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self.budget_ms = budget_ms
+        self.expires_at = clock() + budget_ms / 1000.0
+
+    @classmethod
+    def from_context(cls, context, reserve_ms: float = RESPONSE_RESERVE_MS,
+                     clock: Callable[[], float] = time.monotonic) -> Optional["Deadline"]:
+        """Build a deadline from the Lambda context's remaining time, if available"""
+        get_remaining = getattr(context, "get_remaining_time_in_millis", None)
+        if get_remaining is None:
+            return None
+        return cls(max(get_remaining() - reserve_ms, 0), clock=clock)
+
+    def remaining_ms(self) -> float:
+        return max((self.expires_at - self.clock()) * 1000.0, 0.0)
+
+    def allows(self, needed_ms: float) -> bool:
+        """True if at least `needed_ms` of the budget is left"""
+        return self.remaining_ms() >= needed_ms
+
+    def timeout_ms(self, cap_ms: float) -> int:
+        """Per-stage timeout: the stage cap, shortened to what is left of the budget"""
+        return max(round(min(cap_ms, self.remaining_ms())), 1)
+
+    def __repr__(self):
+        return f"Deadline(remaining_ms={self.remaining_ms():.0f})"
+
+
+def current_deadline() -> Optional[Deadline]:
+    """Deadline of the request being handled, or None when unbounded"""
+    return _current_deadline.get()
+
+
+@contextmanager
+def deadline_scope(deadline: Optional[Deadline]):
+    """Make `deadline` the current deadline for the duration of the block"""
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
@@ -0,0 +1,98 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
+import threading
+import time
+
+# How long the first query of a batch waits for others to join it, and the
+# most queries sent in one endpoint call
+BATCH_WINDOW_MS = 5
+MAX_BATCH_SIZE = 32
+# Batches allowed in flight at once, so a slow call does not hold up the next window
+MAX_IN_FLIGHT = 4
+
+
+class EmbeddingBatcher:
+    """
+    Drop-in for the embeddings client that coalesces embed_query calls made by
+    concurrent requests into one embed_documents call per batch window. Only
+    useful where requests share a process, i.e. server mode; a Lambda
+    container never sees more than one query at a time.
+    """
+
+    def __init__(self, embeddings, window_ms: float = BATCH_WINDOW_MS, max_batch: int = MAX_BATCH_SIZE,
+                 max_in_flight: int = MAX_IN_FLIGHT, clock=time.monotonic):
+        self.embeddings = embeddings
+        self.window_s = window_ms / 1000.0
+        self.max_batch = max_batch
+        self.clock = clock
+        self.pending: List[Tuple[str, Future]] = []
+        self.condition = threading.Condition()
+        self.closed = False
+        self.counters = {"queries": 0, "batches": 0, "failures": 0, "largest_batch": 0}
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="embedding-batch")
+        self.thread = threading.Thread(target=self._collect, name="embedding-batcher", daemon=True)
+        self.thread.start()
+
+    def embed_query(self, text: str) -> List[float]:
+        future: Future = Future()
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("embedding batcher is closed")
+            self.pending.append((text, future))
+            self.condition.notify()
+        return future.result()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def _collect(self):
+        while True:
+            with self.condition:
+                while not self.pending and not self.closed:
+                    self.condition.wait()
+                if not self.pending:
+                    return
+                # the first query has arrived; give others the window to join it
+                window_end = self.clock() + self.window_s
+                while len(self.pending) < self.max_batch and not self.closed:
+                    remaining = window_end - self.clock()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+                batch, self.pending = self.pending[:self.max_batch], self.pending[self.max_batch:]
+            self.executor.submit(self._embed, batch)
+
+    def _embed(self, batch: List[Tuple[str, Future]]):
+        texts = [text for text, _ in batch]
+        try:
+            vectors = self.embeddings.embed_documents(texts)
+            if len(vectors) != len(texts):
+                raise ValueError(f"endpoint returned {len(vectors)} embeddings for {len(texts)} queries")
+        except Exception as e:
+            with self.condition:
+                self.counters["failures"] += 1
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        with self.condition:
+            self.counters["queries"] += len(batch)
+            self.counters["batches"] += 1
+            self.counters["largest_batch"] = max(self.counters["largest_batch"], len(batch))
+        for (_, future), vector in zip(batch, vectors):
+            future.set_result(vector)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self.condition:
+            batches = self.counters["batches"]
+            return {
+                **self.counters,
+                "mean_batch": round(self.counters["queries"] / batches, 2) if batches else 0.0,
+            }
+
+    def close(self):
+        """Flush queued queries and stop the batching threads"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join()
+        self.executor.shutdown(wait=True)
@@ -1,17 +1,26 @@
 import warnings
 warnings.filterwarnings("ignore")
 
-from langchain.chains import RetrievalQA
-from mongodb_retriever import MDBContextRetriever
-from langchain.prompts import PromptTemplate
-try:
-    from langchain_aws.llms import SagemakerEndpoint
-    from langchain_aws.llms.sagemaker_endpoint import LLMContentHandler
-except ImportError:
-    from langchain_community.llms import SagemakerEndpoint
-    from langchain_community.llms.sagemaker_endpoint import LLMContentHandler
+from deadline import current_deadline, deadline_scope
+from mongodb_retriever import MDBContextRetriever, get_settings, sagemaker_runtime_client
+from resilience import CircuitOpenError, call_with_timeout, get_breaker
+from session_context import session_scope
 import json
 import os
+import threading
+
+# Chain built by get_chain(), reused across warm invocations
+_chain = None
+_chain_lock = threading.Lock()
+
+# Generation limits. max_length is shrunk to what the request deadline can
+# afford at Flan-T5's output rate; below GENERATION_MIN_TOKENS the answer is
+# produced by FallbackLLM instead.
+MAX_LENGTH = 500
+GENERATION_MS_PER_TOKEN = 50
+GENERATION_OVERHEAD_MS = 500
+GENERATION_MIN_TOKENS = 32
+LLM_READ_TIMEOUT_S = 25
 
 class FallbackLLM:
     """Simple fallback LLM that summarizes documents without SageMaker"""
@@ -28,7 +37,27 @@ class FallbackLLM:
         else:
             return "No relevant information found in the documents."
 
+def generation_max_length(max_length: int = MAX_LENGTH) -> int:
+    """Largest max_length that can still be generated before the deadline"""
+    deadline = current_deadline()
+    if deadline is None:
+        return max_length
+    affordable = (deadline.remaining_ms() - GENERATION_OVERHEAD_MS) / GENERATION_MS_PER_TOKEN
+    return max(min(max_length, int(affordable)), 0)
+
 def build_chain():
+    # LangChain chains and the SageMaker LLM wrappers are heavy to import, so
+    # they are only loaded when a chain is actually built.
+    from langchain.chains import RetrievalQA
+    from langchain.prompts import PromptTemplate
+    try:
+        from langchain_aws.llms import SagemakerEndpoint
+        from langchain_aws.llms.sagemaker_endpoint import LLMContentHandler
+    except ImportError:
+        from langchain_community.llms import SagemakerEndpoint
+        from langchain_community.llms.sagemaker_endpoint import LLMContentHandler
+
+    get_settings()
     mongodb_uri = os.environ["ATLAS_URI"]
     endpoint_name = os.environ.get("LLM_ENDPOINT", "")
     aws_region = os.environ["AWS_REGION1"]
@@ -42,6 +71,8 @@ def build_chain():
             accepts = "application/json"
 
             def transform_input(self, prompt: str, model_kwargs: dict) -> bytes:
+                model_kwargs = {**model_kwargs,
+                                "max_length": generation_max_length(model_kwargs["max_length"])}
                 input_str = json.dumps({"text_inputs": prompt, **model_kwargs})
                 return input_str.encode('utf-8')
 
@@ -53,8 +84,9 @@ def build_chain():
         llm = SagemakerEndpoint(
                 endpoint_name=endpoint_name,
                 region_name=aws_region,
-                model_kwargs={"temperature":1e-10, "max_length": 500},
-                content_handler=content_handler
+                model_kwargs={"temperature":1e-10, "max_length": MAX_LENGTH},
+                content_handler=content_handler,
+                client=sagemaker_runtime_client(aws_region, LLM_READ_TIMEOUT_S)
             )
     except Exception as e:
         print(f"SageMaker endpoint failed, using fallback LLM: {e}")
@@ -103,20 +135,63 @@ def build_chain():
         
         return SimpleChain(retriever)
 
-def run_chain(chain, prompt: str, history=[]):
+def get_chain():
+    """Return the chain for this container, building it on first use"""
+    global _chain
+    if _chain is None:
+        # server mode can ask for it from several request threads at once
+        with _chain_lock:
+            if _chain is None:
+                _chain = build_chain()
+    return _chain
+
+def run_chain(chain, prompt: str, history=[], deadline=None, session=None):
+    with deadline_scope(deadline), session_scope(session):
+        return _run_chain(chain, prompt)
+
+def _run_chain(chain, prompt: str):
+    combine_documents_chain = getattr(chain, "combine_documents_chain", None)
+    docs = None
     try:
-        # Try the normal chain first
-        result = chain.invoke({"query": prompt})
+        if combine_documents_chain is None:
+            result = chain.invoke({"query": prompt})
+            return {
+                "answer": result['result'],
+                "source_documents": result['source_documents']
+            }
+
+        # Same steps as RetrievalQA, with deadline and endpoint health checks
+        # before generation
+        docs = chain.retriever.invoke(prompt)
+        context = "\n\n".join(doc.page_content for doc in docs)
+        if generation_max_length() < GENERATION_MIN_TOKENS:
+            print(f"⏱️ Not enough time left to generate, {current_deadline()}")
+            answer = FallbackLLM().invoke({"context": context, "question": prompt})
+        else:
+            inputs = {"input_documents": docs, "question": prompt}
+            try:
+                deadline = current_deadline()
+                if deadline is not None:
+                    # the client's read timeout does not know about the deadline
+                    result = get_breaker("llm").call(
+                        call_with_timeout, combine_documents_chain.invoke, inputs, pool="llm",
+                        timeout_ms=deadline.timeout_ms(LLM_READ_TIMEOUT_S * 1000))
+                else:
+                    result = get_breaker("llm").call(combine_documents_chain.invoke, inputs)
+                answer = result["output_text"]
+            except (CircuitOpenError, TimeoutError) as e:
+                print(f"⚡ {e}, using fallback LLM")
+                answer = FallbackLLM().invoke({"context": context, "question": prompt})
         return {
-            "answer": result['result'],
-            "source_documents": result['source_documents']
+            "answer": answer,
+            "source_documents": docs
         }
     except Exception as e:
         print(f"Chain failed: {e}")
         # Fallback: get documents directly and create simple response
         try:
-            retriever = chain.retriever
-            docs = retriever.invoke(prompt)
+            if docs is None:
+                docs = chain.retriever.invoke(prompt)
             
             if docs:
                 # Create a simple summary from the documents
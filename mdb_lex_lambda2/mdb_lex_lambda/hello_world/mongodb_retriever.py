@@ -1,47 +1,116 @@
-from langchain.schema import BaseRetriever, Document
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from deadline import current_deadline
 from pymongo import MongoClient
+from resilience import call_with_timeout, get_breaker, hedged_call
+from retrieval_cache import collection_version, get_retrieval_cache, normalise_query
+from query_router import BOTH, KEYWORD, SEMANTIC, get_router
+from passages import MAX_PASSAGES_PER_PARENT, group_by_parent
+from projection import PROJECTION_VERSION_FIELD, RESCORE_FACTOR, as_floats, get_projection, normalise, rescore
+from session_context import RERANK, SIMILAR, current_session
+from bson import ObjectId
 from pymongo.collection import Collection
-from typing import Dict, List, Optional
-from langchain_community.embeddings import SagemakerEndpointEmbeddings
-from langchain_community.embeddings.sagemaker_endpoint import EmbeddingsContentHandler
+from typing import Any, Dict, List, Optional
+import functools
 import json
 import os
-from dotenv import load_dotenv
 
-# Load environment variables from .env file
-load_dotenv(os.path.join(os.path.dirname(__file__), '..', '.env'))
+# Settings and the SageMaker embeddings client are resolved on first use rather
+# than at import time, so a cold start only pays for what a request needs.
+_settings: Optional[Dict[str, str]] = None
+_embeddings = None
 
-# retrieve the variables from template.yaml
-mongo_db = os.environ["MONGO_DB"]
-aws_region = os.environ["AWS_REGION1"]
-embedding_endpoint_name = os.environ["EMBEDDING_ENDPOINT_NAME"]
-mongo_collection = os.environ["MONGO_COLLECTION"]
-mongo_index = os.environ["MONGO_INDEX"]
+# Per-stage limits. Atlas queries get maxTimeMS capped at these values (and at
+# whatever is left of the request deadline); stages that need more time than
+# remains are skipped.
+COUNT_MAX_TIME_MS = 1000
+SEARCH_MAX_TIME_MS = 2000
+SEMANTIC_MIN_MS = 1500
+FALLBACK_MIN_MS = 1000
+EMBEDDING_READ_TIMEOUT_S = 3
+# Reading the router's title/cast dictionary; only the first request of a
+# container waits for it, rebuilds and retries run in the background
+ROUTER_MAX_TIME_MS = 2000
 
-print("MongoDB : " + str(mongo_db))
+# Reciprocal rank fusion constant used to merge keyword and semantic rankings
+RRF_K = 60
 
-class ContentHandler(EmbeddingsContentHandler):
-    content_type = "application/json"
-    accepts = "application/json"
 
-    def transform_input(self, inputs: list[str], model_kwargs: Dict) -> bytes:
-        payload = {"inputs": inputs}
-        input_str = json.dumps(payload)
-        return input_str.encode("utf-8")
+def get_settings() -> Dict[str, str]:
+    """Read the MongoDB/SageMaker settings once per container"""
+    global _settings
+    if _settings is None:
+        if "AWS_LAMBDA_FUNCTION_NAME" not in os.environ:
+            # Load environment variables from .env file when running locally
+            from dotenv import load_dotenv
+            load_dotenv(os.path.join(os.path.dirname(__file__), '..', '.env'))
 
-    def transform_output(self, output: bytes) -> List[List[float]]:
-        response_json = json.loads(output.read().decode("utf-8"))
-        return response_json
+        # retrieve the variables from template.yaml
+        _settings = {
+            "mongo_db": os.environ["MONGO_DB"],
+            "aws_region": os.environ["AWS_REGION1"],
+            "embedding_endpoint_name": os.environ["EMBEDDING_ENDPOINT_NAME"],
+            "mongo_collection": os.environ["MONGO_COLLECTION"],
+            "mongo_index": os.environ["MONGO_INDEX"],
+            "mongo_meta_collection": os.environ.get(
+                "MONGO_META_COLLECTION", os.environ["MONGO_COLLECTION"] + "_meta"),
+            # Passage-level index written by mongodb_vectorization_search.py
+            # with INDEX_MODE=passages; empty to search whole documents
+            "mongo_chunk_collection": os.environ.get("MONGO_CHUNK_COLLECTION", ""),
+            "mongo_chunk_index": os.environ.get("MONGO_CHUNK_INDEX", os.environ["MONGO_INDEX"]),
+            # Index on the reduced vectors written by util/fit_projection.py;
+            # empty to search the full vectors only
+            "mongo_reduced_index": os.environ.get("MONGO_REDUCED_INDEX", ""),
+        }
+        print("MongoDB : " + str(_settings["mongo_db"]))
+    return _settings
 
 
-content_handler = ContentHandler()
+def sagemaker_runtime_client(region_name: str, read_timeout_s: float):
+    """
+    SageMaker runtime client that gives up on slow responses. Server mode
+    shares it between request threads; SAGEMAKER_MAX_POOL_CONNECTIONS sizes
+    its connection pool (10 by default, server.start() raises it to the
+    number of request threads).
+    """
+    import boto3
+    from botocore.config import Config
 
+    config = Config(connect_timeout=2, read_timeout=read_timeout_s,
+                    retries={"max_attempts": 1},
+                    max_pool_connections=int(os.environ.get("SAGEMAKER_MAX_POOL_CONNECTIONS", "10")))
+    return boto3.client("sagemaker-runtime", region_name=region_name, config=config)
+
+
+def get_embeddings():
+    """Create the SageMaker embeddings client on first use"""
+    global _embeddings
+    if _embeddings is None:
+        from langchain_community.embeddings import SagemakerEndpointEmbeddings
+        from langchain_community.embeddings.sagemaker_endpoint import EmbeddingsContentHandler
+
+        class ContentHandler(EmbeddingsContentHandler):
+            content_type = "application/json"
+            accepts = "application/json"
+
+            def transform_input(self, inputs: list[str], model_kwargs: Dict) -> bytes:
+                payload = {"inputs": inputs}
+                input_str = json.dumps(payload)
+                return input_str.encode("utf-8")
+
+            def transform_output(self, output: bytes) -> List[List[float]]:
+                response_json = json.loads(output.read().decode("utf-8"))
+                return response_json
+
+        settings = get_settings()
+        _embeddings = SagemakerEndpointEmbeddings(
+            endpoint_name=settings["embedding_endpoint_name"],
+            region_name=settings["aws_region"],
+            content_handler=ContentHandler(),
+            client=sagemaker_runtime_client(settings["aws_region"], EMBEDDING_READ_TIMEOUT_S),
+        )
+    return _embeddings
 
-embeddings = SagemakerEndpointEmbeddings(
-    endpoint_name=embedding_endpoint_name,
-    region_name=aws_region,
-    content_handler=content_handler,
-)
 
 class MDBContextRetriever(BaseRetriever):
     """Retriever to retrieve documents from MongoDB using Vector index."""
@@ -50,19 +119,310 @@ class MDBContextRetriever(BaseRetriever):
     return_source_documents: bool = False
     client: Optional[MongoClient] = None
     collection: Optional[Collection] = None
-    embeddings: Optional[SagemakerEndpointEmbeddings] = None
+    meta_collection: Optional[Collection] = None
+    chunk_collection: Optional[Collection] = None
+    chunk_index_name: str = ""
+    embeddings: Optional[Any] = None
+    index_name: str = ""
+    reduced_index_name: str = ""
+    search_mode: str = "hybrid"
+    query_routing: bool = True
 
-    def __init__(self, mongodb_uri, k=2, return_source_documents=False):
+    def __init__(self, mongodb_uri, k=2, return_source_documents=False, embeddings=None):
         super().__init__()
+        settings = get_settings()
         self.k = k
         self.return_source_documents = return_source_documents
         self.client = MongoClient(mongodb_uri)
-        self.collection = self.client[mongo_db][mongo_collection]
+        self.collection = self.client[settings["mongo_db"]][settings["mongo_collection"]]
+        self.meta_collection = self.client[settings["mongo_db"]][settings["mongo_meta_collection"]]
+        self.index_name = settings["mongo_index"]
+        self.reduced_index_name = settings["mongo_reduced_index"]
         self.embeddings = embeddings
+        if settings["mongo_chunk_collection"]:
+            self.chunk_collection = self.client[settings["mongo_db"]][settings["mongo_chunk_collection"]]
+            self.chunk_index_name = settings["mongo_chunk_index"]
+            self.search_mode = "passages"
+
+    @property
+    def query_embeddings(self):
+        """Embeddings client, created lazily on the first semantic search"""
+        if self.embeddings is None:
+            self.embeddings = get_embeddings()
+        return self.embeddings
+
+    def _max_time_ms(self, cap_ms: int) -> int:
+        """maxTimeMS for an Atlas query, bounded by the request deadline"""
+        deadline = current_deadline()
+        return deadline.timeout_ms(cap_ms) if deadline else cap_ms
+
+    def _embed_query(self, query: str) -> List[float]:
+        """
+        Embed the query through the embedding endpoint's circuit breaker, as a
+        flat list of floats whatever nesting the endpoint returns. Set
+        EMBEDDING_HEDGE_PERCENTILE (e.g. 95) to hedge calls slower than that
+        percentile with a second request. Under a request deadline the call is
+        abandoned once the deadline leaves less than EMBEDDING_READ_TIMEOUT_S.
+        """
+        breaker = get_breaker("embedding")
+        embed = self.query_embeddings.embed_query
+        hedge_percentile = float(os.environ.get("EMBEDDING_HEDGE_PERCENTILE", "0"))
+        if hedge_percentile:
+            embed = functools.partial(hedged_call, embed, breaker=breaker, percentile=hedge_percentile)
+        deadline = current_deadline()
+        if deadline is not None:
+            embedding = breaker.call(call_with_timeout, embed, query, pool="embedding",
+                                     timeout_ms=deadline.timeout_ms(EMBEDDING_READ_TIMEOUT_S * 1000))
+        else:
+            embedding = breaker.call(embed, query)
+
+        # Flatten embedding
+        def flatten_embedding(embedding):
+            if isinstance(embedding, list):
+                if len(embedding) == 1 and isinstance(embedding[0], list):
+                    return flatten_embedding(embedding[0])
+                elif all(isinstance(x, (int, float)) for x in embedding):
+                    return embedding
+                elif len(embedding) > 0 and isinstance(embedding[0], list):
+                    return flatten_embedding(embedding[0])
+            return embedding
+
+        return [float(x) for x in flatten_embedding(embedding)]
+
+    def _has_time_for(self, needed_ms: int) -> bool:
+        deadline = current_deadline()
+        return deadline is None or deadline.allows(needed_ms)
+
+    def _collection_version(self):
+        """Version token bumped by the embedding pipeline on every write, cached for VERSION_TTL_S"""
+        try:
+            return collection_version(self.meta_collection, self._max_time_ms(COUNT_MAX_TIME_MS))
+        except Exception as e:
+            print(f"❌ Could not read collection version: {e}")
+            return None
 
     def _get_relevant_documents(self, query: str) -> List[Document]:
-        """Hybrid search: keyword search first, then semantic search"""
-        doc_count = self.collection.count_documents({})
+        """Answer Lex follow-ups from the previous turn's results, else retrieve"""
+        session = current_session()
+        if session is None:
+            return self._retrieve(query)
+
+        docs = self._follow_up(query, session)
+        if docs:
+            return docs
+
+        session.query_vector = None
+        docs = self._retrieve(query)
+        session.remember([doc.metadata["_id"] for doc in docs], session.query_vector, self._passage_ids(docs))
+        session.record(retrieved=True)
+        return docs
+
+    def _follow_up(self, query: str, session) -> Optional[List[Document]]:
+        """Reuse the session's candidates, or its query vector, for a follow-up turn"""
+        kind = session.follow_up_kind(query)
+        if kind is None:
+            return None
+        try:
+            if kind == RERANK:
+                docs = self._candidate_documents(query, session.ids, session.passages)
+                if docs:
+                    print(f"💬 Follow-up: re-ranked {len(docs)} documents from the previous turn")
+                    session.record(retrieved=False)
+                return docs
+            if kind == SIMILAR:
+                # a keyword-only turn embedded nothing; use its results' own vectors instead
+                query_vector = session.query_vector or self._centroid(session.ids)
+                if query_vector is None:
+                    return None
+                seen = set(session.ids)
+                search = self._passage_search if self.chunk_collection is not None else self._vector_search
+                docs = [doc for doc in search(query_vector, limit=self.k + len(seen))
+                        if doc.metadata["_id"] not in seen][:self.k]
+                if docs:
+                    print(f"💬 Follow-up: {len(docs)} similar documents using the previous query vector")
+                    session.remember(session.ids + [doc.metadata["_id"] for doc in docs], query_vector,
+                                     {**session.passages, **self._passage_ids(docs)})
+                    session.record(retrieved=True, embedding_avoided=True)
+                return docs
+        except Exception as e:
+            print(f"❌ Follow-up reuse failed: {e}")
+        return None
+
+    def _centroid(self, doc_ids: List[str]) -> Optional[List[float]]:
+        """Normalised mean of the stored vectors of `doc_ids`, or None if none have one"""
+        field = os.getenv("VECTORIZED_FIELD_NAME")
+        results = self.collection.find(
+            {"_id": {"$in": [self._raw_id(doc_id) for doc_id in doc_ids]}}, {"_id": 1, field: 1}
+        ).max_time_ms(self._max_time_ms(SEARCH_MAX_TIME_MS))
+        vectors = [as_floats(result[field]) for result in results if result.get(field) is not None]
+        if not vectors:
+            return None
+        return normalise([sum(values) / len(vectors) for values in zip(*vectors)])
+
+    @staticmethod
+    def _passage_ids(docs: List[Document]) -> Dict[str, List[str]]:
+        return {doc.metadata["_id"]: doc.metadata["passage_ids"] for doc in docs if doc.metadata.get("passage_ids")}
+
+    def _candidate_documents(self, query: str, doc_ids: List[str],
+                             passage_ids: Optional[Dict[str, List[str]]] = None) -> List[Document]:
+        """Fetch the previous turn's documents by _id and re-rank them for the follow-up
+
+        In passage mode the previous turn's passages are re-fetched instead of the fullplot.
+        """
+        passages = {}
+        if self.chunk_collection is not None and passage_ids:
+            wanted = [self._raw_id(passage_id) for doc_id in doc_ids for passage_id in passage_ids.get(doc_id, ())]
+            by_passage_id = {str(hit["_id"]): hit for hit in self.chunk_collection.find(
+                {"_id": {"$in": wanted}}, {"_id": 1, "chunk_index": 1, "text": 1}
+            ).max_time_ms(self._max_time_ms(SEARCH_MAX_TIME_MS))}
+            for doc_id in doc_ids:
+                ids = passage_ids.get(doc_id, ())
+                if ids and all(passage_id in by_passage_id for passage_id in ids):
+                    passages[doc_id] = [by_passage_id[passage_id] for passage_id in ids]
+
+        fields = {"_id": 1, "title": 1, "year": 1, "cast": 1, "genres": 1}
+        if any(doc_id not in passages for doc_id in doc_ids):
+            fields["fullplot"] = 1
+        results = self.collection.find(
+            {"_id": {"$in": [self._raw_id(doc_id) for doc_id in doc_ids]}}, fields
+        ).max_time_ms(self._max_time_ms(SEARCH_MAX_TIME_MS))
+        by_id = {str(result["_id"]): result for result in results}
+        candidates = [by_id[doc_id] for doc_id in doc_ids if doc_id in by_id]
+
+        def plot(result):
+            hits = passages.get(str(result["_id"]))
+            if hits is None:
+                return result.get("fullplot", "")
+            return "\n...\n".join(hit.get("text", "") for hit in hits)
+
+        # Stable sort: term overlap first, previous ranking on ties
+        terms = set(normalise_query(query).split())
+        def overlap(result):
+            text = " ".join([result.get("title", ""), plot(result),
+                             " ".join(result.get("cast", [])), " ".join(result.get("genres", []))])
+            return len(terms & set(normalise_query(text).split()))
+        candidates.sort(key=overlap, reverse=True)
+
+        docs = []
+        for rank, result in enumerate(candidates[:self.k], 1):
+            details = [plot(result)]
+            if result.get("cast"):
+                details.append("Cast: " + ", ".join(result["cast"]))
+            if result.get("year"):
+                details.append(f"Year: {result['year']}")
+            metadata = {
+                "title": result.get("title", ""),
+                "score": 1.0 / rank,
+                "search_type": "SESSION",
+                "_id": str(result["_id"])
+            }
+            if str(result["_id"]) in passages:
+                metadata["passage_ids"] = [str(hit["_id"]) for hit in passages[str(result["_id"])]]
+            docs.append(Document(page_content="\n".join(details), metadata=metadata))
+        return docs
+
+    def _retrieve(self, query: str) -> List[Document]:
+        """Serve repeated queries from the retrieval cache, else run the hybrid search"""
+        cache = get_retrieval_cache()
+        key = cache.key(query, self.k, self.search_mode)
+        version = self._collection_version()
+        if version is None:
+            return self._hybrid_search(query, version)
+
+        session = current_session()
+        entry = cache.get_entry(key, version)
+        if entry is not None:
+            hits, query_vector = entry
+            docs = self._hydrate(hits)
+            if len(docs) == len(hits):
+                print(f"♻️ Retrieval cache HIT for '{query}' (version {version}): {len(docs)} documents")
+                if session is not None:
+                    session.query_vector = query_vector
+                return docs
+
+        docs = self._hybrid_search(query, version)
+        # Only complete keyword/semantic rankings are cached; fallback or
+        # deadline-degraded results are recomputed next time.
+        if docs and all(doc.metadata.get("search_type") in ("KEYWORD", "SEMANTIC") for doc in docs):
+            cache.put(key, version, [(self._raw_id(doc.metadata["_id"]), doc.metadata["score"],
+                                      doc.metadata["search_type"],
+                                      tuple(self._raw_id(passage_id)
+                                            for passage_id in doc.metadata.get("passage_ids", ())))
+                                     for doc in docs],
+                      query_vector=session.query_vector if session is not None else None)
+        return docs
+
+    @staticmethod
+    def _raw_id(doc_id: str):
+        return ObjectId(doc_id) if ObjectId.is_valid(doc_id) else doc_id
+
+    def _hydrate(self, hits) -> List[Document]:
+        """Fetch cached hits by _id, keeping the cached order and scores"""
+        ids = [doc_id for doc_id, _, _, _ in hits]
+        passage_ids = [passage_id for _, _, _, passages in hits for passage_id in passages]
+        try:
+            results = self.collection.find(
+                {"_id": {"$in": ids}}, {"_id": 1, "fullplot": 1, "title": 1, "year": 1}
+            ).max_time_ms(self._max_time_ms(SEARCH_MAX_TIME_MS))
+            by_id = {result["_id"]: result for result in results}
+            passages_by_id = {}
+            if passage_ids:
+                passages_by_id = {hit["_id"]: hit for hit in self.chunk_collection.find(
+                    {"_id": {"$in": passage_ids}}, {"_id": 1, "chunk_index": 1, "text": 1}
+                ).max_time_ms(self._max_time_ms(SEARCH_MAX_TIME_MS))}
+        except Exception as e:
+            print(f"❌ Cache hydration failed: {e}")
+            return []
+        docs = []
+        for doc_id, score, search_type, passages in hits:
+            result = by_id.get(doc_id)
+            if result is None:
+                continue
+            if passages:
+                if not all(passage_id in passages_by_id for passage_id in passages):
+                    continue
+                docs.append(self._passage_document(
+                    doc_id, result, score, search_type, [passages_by_id[passage_id] for passage_id in passages]))
+                continue
+            docs.append(Document(
+                page_content=result.get("fullplot", ""),
+                metadata={
+                    "title": result.get("title", ""),
+                    "score": score,
+                    "search_type": search_type,
+                    "_id": str(doc_id)
+                }
+            ))
+        return docs
+
+    def _semantic_available(self) -> bool:
+        """
+        False while the embedding circuit would refuse the call (open, or
+        half-open with another request's probe in flight) or too little of the
+        deadline is left
+        """
+        breaker = get_breaker("embedding")
+        if not breaker.available():
+            print(f"⚠️ Embedding endpoint circuit is {breaker.state}, using keyword search")
+            return False
+        if not self._has_time_for(SEMANTIC_MIN_MS):
+            print(f"⏱️ Skipping semantic search, {current_deadline()}")
+            return False
+        return True
+
+    def _route(self, query: str, version=None):
+        """Pick keyword, semantic or both up front; keyword-first if no router"""
+        router = None
+        if self.query_routing:
+            router = get_router(self.collection, version, self._max_time_ms(ROUTER_MAX_TIME_MS))
+        if router is None:
+            return KEYWORD, "routing disabled"
+        return router.route(query)
+
+    def _hybrid_search(self, query: str, version=None) -> List[Document]:
+        """Hybrid search routed by the query router: keyword, semantic or both"""
+        doc_count = self.collection.estimated_document_count(
+            maxTimeMS=self._max_time_ms(COUNT_MAX_TIME_MS))
         print(f"\n{'='*60}")
         print(f"🔍 HYBRID SEARCH STARTED")
         print(f"Query: '{query}'")
@@ -71,7 +431,31 @@ class MDBContextRetriever(BaseRetriever):
         
         if doc_count == 0:
             return []
-        
+
+        route, reason = self._route(query, version)
+        print(f"🧭 Route: {route.upper()} ({reason})")
+
+        if route == SEMANTIC and not self._semantic_available():
+            # keyword search is still cheaper and better than the regex fallback
+            route = KEYWORD
+
+        if route == SEMANTIC:
+            print(f"\n🧠 STEP 1: SEMANTIC SEARCH")
+            print(f"{'-'*40}")
+            return self._semantic_search(query, version)
+
+        if route == BOTH:
+            print(f"\n📝 STEP 1: KEYWORD + SEMANTIC SEARCH")
+            print(f"{'-'*40}")
+            keyword_docs = self._keyword_search(query)
+            semantic_docs = []
+            if self._has_time_for(SEMANTIC_MIN_MS):
+                semantic_docs = self._semantic_search(query, version)
+            if keyword_docs:
+                # regex fallback results only stand in when keyword search found nothing
+                semantic_docs = [doc for doc in semantic_docs if doc.metadata.get("search_type") == "SEMANTIC"]
+            return self._fuse(keyword_docs, semantic_docs)
+
         # Step 1: Try keyword search first
         print(f"\n📝 STEP 1: KEYWORD SEARCH")
         print(f"{'-'*40}")
@@ -82,16 +466,30 @@ class MDBContextRetriever(BaseRetriever):
         
         # Step 2: Fall back to semantic search
         print(f"❌ Keyword search returned 0 results")
+        if not self._has_time_for(SEMANTIC_MIN_MS):
+            print(f"⏱️ Skipping semantic search, {current_deadline()}")
+            return []
         print(f"\n🧠 STEP 2: SEMANTIC SEARCH")
         print(f"{'-'*40}")
-        return self._semantic_search(query)
+        return self._semantic_search(query, version)
     
+    def _fuse(self, *rankings: List[Document]) -> List[Document]:
+        """Merge rankings with reciprocal rank fusion, keeping each document once"""
+        fused = {}
+        for ranking in rankings:
+            for rank, doc in enumerate(ranking):
+                doc_id = doc.metadata.get("_id")
+                score, first = fused.get(doc_id, (0.0, doc))
+                fused[doc_id] = (score + 1.0 / (RRF_K + rank + 1), first)
+        ranked = sorted(fused.values(), key=lambda item: item[0], reverse=True)
+        return [doc for _, doc in ranked[:self.k]]
+
     def _keyword_search(self, query: str) -> List[Document]:
         """MongoDB Atlas text search"""
         try:
             pipeline = [{
                 "$search": {
-                    "index": mongo_index,
+                    "index": self.index_name,
                     "text": {
                         "query": query,
                         "path": {"wildcard": "*"}
@@ -111,8 +509,9 @@ class MDBContextRetriever(BaseRetriever):
                 "$limit": self.k
             }]
             
-            print(f"Using MongoDB Atlas Text Search with index: {mongo_index}")
-            results = list(self.collection.aggregate(pipeline))
+            print(f"Using MongoDB Atlas Text Search with index: {self.index_name}")
+            results = list(self.collection.aggregate(
+                pipeline, maxTimeMS=self._max_time_ms(SEARCH_MAX_TIME_MS)))
             docs = []
             for i, result in enumerate(results, 1):
                 score = result.get("score", 0)
@@ -132,64 +531,20 @@ class MDBContextRetriever(BaseRetriever):
             print(f"❌ Keyword search failed: {e}")
             return []
     
-    def _semantic_search(self, query: str) -> List[Document]:
+    def _semantic_search(self, query: str, version=None) -> List[Document]:
         """Vector/semantic search"""
         try:
-            query_embedding = self.embeddings.embed_query(query)
-            
-            # Flatten embedding
-            def flatten_embedding(embedding):
-                if isinstance(embedding, list):
-                    if len(embedding) == 1 and isinstance(embedding[0], list):
-                        return flatten_embedding(embedding[0])
-                    elif all(isinstance(x, (int, float)) for x in embedding):
-                        return embedding
-                    elif len(embedding) > 0 and isinstance(embedding[0], list):
-                        return flatten_embedding(embedding[0])
-                return embedding
-            
-            query_embedding = flatten_embedding(query_embedding)
-            query_embedding = [float(x) for x in query_embedding]
+            query_embedding = self._embed_query(query)
             print(f"Generated embedding vector: {len(query_embedding)} dimensions")
-            
-            pipeline = [{
-                "$vectorSearch": {
-                    "index": mongo_index,
-                    "path": os.getenv("VECTORIZED_FIELD_NAME"),
-                    "queryVector": query_embedding,
-                    "numCandidates": 150,
-                    "limit": self.k,
-                    "filter": {}
-                }
-            }, {
-                "$project": {
-                    "_id": 1,
-                    "fullplot": 1,
-                    "title": 1,
-                    "genres": 1,
-                    "cast": 1,
-                    "year": 1,
-                    "score": {"$meta": "vectorSearchScore"}
-                }
-            }]
-            
-            print(f"Using MongoDB Vector Search with index: {mongo_index}")
-            results = list(self.collection.aggregate(pipeline))
-            docs = []
-            for i, result in enumerate(results, 1):
-                score = result.get("score", 0)
-                print(f"  🎯 #{i} [{score:.4f}] {result.get('title')} ({result.get('year', 'N/A')})")
-                doc = Document(
-                    page_content=result.get("fullplot", ""),
-                    metadata={
-                        "title": result.get("title", ""),
-                        "score": score,
-                        "search_type": "SEMANTIC",
-                        "_id": str(result.get("_id", ""))
-                    }
-                )
-                docs.append(doc)
-            
+            session = current_session()
+            if session is not None:
+                session.query_vector = query_embedding
+
+            if self.chunk_collection is not None:
+                docs = self._passage_search(query_embedding)
+            else:
+                docs = self._vector_search(query_embedding, version=version)
+
             if docs:
                 print(f"✅ Semantic search SUCCESS: {len(docs)} documents found")
                 return docs
@@ -204,8 +559,152 @@ class MDBContextRetriever(BaseRetriever):
             print(f"{'-'*40}")
             return self._simple_search(query)
 
+    def _vector_search(self, query_embedding: List[float], limit: Optional[int] = None,
+                       version=None) -> List[Document]:
+        """$vectorSearch over whole-document vectors"""
+        if self.reduced_index_name:
+            try:
+                docs = self._two_stage_search(query_embedding, limit, version)
+            except Exception as e:
+                print(f"❌ Two-stage search failed, searching full vectors: {e}")
+                docs = []
+            if docs:
+                return docs
+
+        pipeline = [{
+            "$vectorSearch": {
+                "index": self.index_name,
+                "path": os.getenv("VECTORIZED_FIELD_NAME"),
+                "queryVector": query_embedding,
+                "numCandidates": 150,
+                "limit": limit or self.k,
+                "filter": {}
+            }
+        }, {
+            "$project": {
+                "_id": 1,
+                "fullplot": 1,
+                "title": 1,
+                "genres": 1,
+                "cast": 1,
+                "year": 1,
+                "score": {"$meta": "vectorSearchScore"}
+            }
+        }]
+        
+        print(f"Using MongoDB Vector Search with index: {self.index_name}")
+        results = list(self.collection.aggregate(
+            pipeline, maxTimeMS=self._max_time_ms(SEARCH_MAX_TIME_MS)))
+        return self._semantic_documents(results)
+
+    def _two_stage_search(self, query_embedding: List[float], limit: Optional[int] = None,
+                          version=None) -> List[Document]:
+        """$vectorSearch on reduced vectors for a wider candidate set, rescored on the full vectors"""
+        projection = get_projection(self.meta_collection, version)
+        if projection is None:
+            return []
+        limit = limit or self.k
+        candidates = limit * RESCORE_FACTOR
+        pipeline = [{
+            "$vectorSearch": {
+                "index": self.reduced_index_name,
+                "path": projection.field,
+                "queryVector": projection.project(query_embedding),
+                "numCandidates": min(candidates * 10, 10000),
+                "limit": candidates,
+                "filter": {PROJECTION_VERSION_FIELD: projection.version}
+            }
+        }, {
+            "$project": {
+                "_id": 1,
+                "fullplot": 1,
+                "title": 1,
+                "year": 1,
+                projection.source_field: 1
+            }
+        }]
+
+        print(f"Using two-stage search: {projection.dimensions}-d index {self.reduced_index_name}, "
+              f"rescoring {candidates} candidates on {projection.source_field}")
+        results = list(self.collection.aggregate(
+            pipeline, maxTimeMS=self._max_time_ms(SEARCH_MAX_TIME_MS)))
+        return self._semantic_documents(rescore(query_embedding, results, projection.source_field, limit))
+
+    @staticmethod
+    def _semantic_documents(results: List[Dict]) -> List[Document]:
+        docs = []
+        for i, result in enumerate(results, 1):
+            score = result.get("score", 0)
+            print(f"  🎯 #{i} [{score:.4f}] {result.get('title')} ({result.get('year', 'N/A')})")
+            doc = Document(
+                page_content=result.get("fullplot", ""),
+                metadata={
+                    "title": result.get("title", ""),
+                    "score": score,
+                    "search_type": "SEMANTIC",
+                    "_id": str(result.get("_id", ""))
+                }
+            )
+            docs.append(doc)
+        return docs
+
+    def _passage_search(self, query_embedding: List[float], limit: Optional[int] = None) -> List[Document]:
+        """$vectorSearch over passages, grouped by parent; only matching passages become context"""
+        pipeline = [{
+            "$vectorSearch": {
+                "index": self.chunk_index_name,
+                "path": os.getenv("VECTORIZED_FIELD_NAME"),
+                "queryVector": query_embedding,
+                "numCandidates": 150,
+                "limit": (limit or self.k) * MAX_PASSAGES_PER_PARENT * 2,
+                "filter": {}
+            }
+        }, {
+            "$project": {
+                "_id": 1,
+                "parent_id": 1,
+                "chunk_index": 1,
+                "text": 1,
+                "score": {"$meta": "vectorSearchScore"}
+            }
+        }]
+
+        print(f"Using MongoDB Passage Vector Search with index: {self.chunk_index_name}")
+        hits = list(self.chunk_collection.aggregate(
+            pipeline, maxTimeMS=self._max_time_ms(SEARCH_MAX_TIME_MS)))
+        groups = group_by_parent(hits, limit or self.k)
+        parents = {parent["_id"]: parent for parent in self.collection.find(
+            {"_id": {"$in": [group["parent_id"] for group in groups]}}, {"_id": 1, "title": 1, "year": 1}
+        ).max_time_ms(self._max_time_ms(SEARCH_MAX_TIME_MS))}
+
+        docs = []
+        for i, group in enumerate(groups, 1):
+            parent = parents.get(group["parent_id"], {})
+            score = group["score"]
+            print(f"  🎯 #{i} [{score:.4f}] {parent.get('title')} ({parent.get('year', 'N/A')}) "
+                  f"passages {[hit.get('chunk_index') for hit in group['passages']]}")
+            docs.append(self._passage_document(group["parent_id"], parent, score, "SEMANTIC", group["passages"]))
+        print(f"✂️ Passage context: {sum(len(doc.page_content) for doc in docs)} chars")
+        return docs
+
+    @staticmethod
+    def _passage_document(parent_id, parent, score, search_type, passages) -> Document:
+        return Document(
+            page_content="\n...\n".join(hit.get("text", "") for hit in passages),
+            metadata={
+                "title": parent.get("title", ""),
+                "score": score,
+                "search_type": search_type,
+                "_id": str(parent_id),
+                "passage_ids": [str(hit["_id"]) for hit in passages]
+            }
+        )
+
     def _simple_search(self, query: str) -> List[Document]:
         """Simple regex search fallback"""
+        if not self._has_time_for(FALLBACK_MIN_MS):
+            print(f"⏱️ Skipping fallback search, {current_deadline()}")
+            return []
         try:
             search_terms = query.lower().split()
             print(f"Using MongoDB regex search for terms: {search_terms}")
@@ -214,7 +713,7 @@ class MDBContextRetriever(BaseRetriever):
             or_conditions = [{"fullplot": {"$regex": term, "$options": "i"}} for term in search_terms]
             results = list(self.collection.find(
                 {"$or": or_conditions}
-            ).limit(self.k))
+            ).limit(self.k).max_time_ms(self._max_time_ms(SEARCH_MAX_TIME_MS)))
             
             # If no results, try searching in other fields
             if not results:
@@ -225,11 +724,12 @@ class MDBContextRetriever(BaseRetriever):
                 ]
                 results = list(self.collection.find(
                     {"$or": or_conditions}
-                ).limit(self.k))
+                ).limit(self.k).max_time_ms(self._max_time_ms(SEARCH_MAX_TIME_MS)))
             
             # If still no results, just get any documents
             if not results:
-                results = list(self.collection.find().limit(self.k))
+                results = list(self.collection.find().limit(self.k).max_time_ms(
+                    self._max_time_ms(SEARCH_MAX_TIME_MS)))
             
             docs = []
             for i, result in enumerate(results, 1):
@@ -254,7 +754,7 @@ class MDBContextRetriever(BaseRetriever):
             print(f"❌ Simple search failed: {e}")
             return []
 
-    def invoke(self, query: str) -> List[Document]:
+    def invoke(self, query: str, config=None, **kwargs) -> List[Document]:
         """Invoke the retriever with a query string"""
         return self._get_relevant_documents(query)
     
@@ -264,6 +764,7 @@ class MDBContextRetriever(BaseRetriever):
 
 if __name__ == "__main__":
     # Test the retriever
+    get_settings()
     atlas_uri = os.environ.get("ATLAS_URI")
     if atlas_uri:
         retriever = MDBContextRetriever(atlas_uri)
@@ -0,0 +1,46 @@
+from typing import Dict, List
+
+# MiniLM reads at most 256 word pieces, roughly 190 English words. Passages are
+# kept under that so the whole passage contributes to its embedding.
+PASSAGE_WORDS = 150
+PASSAGE_OVERLAP_WORDS = 30
+MAX_PASSAGES_PER_PARENT = 2
+
+
+def split_passages(text: str, max_words: int = PASSAGE_WORDS,
+                   overlap_words: int = PASSAGE_OVERLAP_WORDS) -> List[str]:
+    """Split text into overlapping word windows of at most `max_words` words"""
+    if overlap_words >= max_words:
+        raise ValueError("overlap_words must be smaller than max_words")
+    words = text.split()
+    if not words:
+        return []
+    passages = []
+    step = max_words - overlap_words
+    for start in range(0, len(words), step):
+        passages.append(" ".join(words[start:start + max_words]))
+        if start + max_words >= len(words):
+            break
+    return passages
+
+
+def group_by_parent(hits: List[Dict], k: int,
+                    max_passages: int = MAX_PASSAGES_PER_PARENT) -> List[Dict]:
+    """
+    Group passage hits (ordered best first) by parent document. Returns up to
+    `k` parents in order of their best passage, each with its top passages
+    put back into reading order.
+    """
+    parents: Dict = {}
+    for hit in hits:
+        parent = parents.get(hit["parent_id"])
+        if parent is None:
+            if len(parents) == k:
+                continue
+            parent = parents[hit["parent_id"]] = {"parent_id": hit["parent_id"],
+                                                  "score": hit.get("score", 0), "passages": []}
+        if len(parent["passages"]) < max_passages:
+            parent["passages"].append(hit)
+    for parent in parents.values():
+        parent["passages"].sort(key=lambda hit: hit.get("chunk_index", 0))
+    return list(parents.values())
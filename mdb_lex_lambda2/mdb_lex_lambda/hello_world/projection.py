@@ -0,0 +1,128 @@
+from array import array
+from bson.binary import VECTOR_SUBTYPE, Binary, BinaryVectorDtype
+from typing import Any, Dict, List, Optional
+import math
+import threading
+
+# Document in the metadata collection describing the projection that produced
+# the reduced vectors; written by util/fit_projection.py
+PROJECTION_DOC_ID = "projection"
+# Each reduced vector is stamped with the version of the projection that made
+# it, so a query is only ever compared with vectors from the same projection
+PROJECTION_VERSION_FIELD = "projectionVersion"
+# First-pass candidates fetched on the reduced vectors per result returned
+RESCORE_FACTOR = 10
+
+PCA = "pca"
+TRUNCATE = "truncate"
+
+_projection: Optional["Projection"] = None
+_projection_version = None
+_projection_loaded = False
+_projection_lock = threading.Lock()
+
+
+def as_floats(vector) -> List[float]:
+    """Stored vector (list, or BSON float32 vector) as a list of floats"""
+    if isinstance(vector, bytes):
+        if not isinstance(vector, Binary) or vector.subtype != VECTOR_SUBTYPE:
+            raise ValueError("binary vectors must be BSON vectors")
+        if vector[:1] != BinaryVectorDtype.FLOAT32.value:
+            raise ValueError("only float32 BSON vectors are supported")
+        # skip the dtype and padding header bytes
+        values = array("f")
+        values.frombytes(bytes(vector[2:]))
+        return values.tolist()
+    return [float(x) for x in vector]
+
+
+def normalise(vector: List[float]) -> List[float]:
+    norm = math.sqrt(sum(x * x for x in vector))
+    return [x / norm for x in vector] if norm else list(vector)
+
+
+def cosine(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a) * sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class Projection:
+    """Linear map from full embeddings to the reduced vectors searched first"""
+
+    def __init__(self, version: int, method: str, dimensions: int, source_field: str, field: str,
+                 mean: Optional[List[float]] = None, components: Optional[List[List[float]]] = None,
+                 explained_variance: Optional[float] = None):
+        if method == PCA and (mean is None or components is None):
+            raise ValueError("a PCA projection needs a mean and components")
+        self.version = version
+        self.method = method
+        self.dimensions = dimensions
+        self.source_field = source_field
+        self.field = field
+        self.mean = mean
+        self.components = components
+        self.explained_variance = explained_variance
+
+    @classmethod
+    def from_document(cls, document: Dict[str, Any]) -> "Projection":
+        return cls(document["version"], document["method"], document["dimensions"],
+                   document["source_field"], document["field"], document.get("mean"),
+                   document.get("components"), document.get("explained_variance"))
+
+    def to_document(self) -> Dict[str, Any]:
+        return {
+            "_id": PROJECTION_DOC_ID,
+            "version": self.version,
+            "method": self.method,
+            "dimensions": self.dimensions,
+            "source_field": self.source_field,
+            "field": self.field,
+            "mean": self.mean,
+            "components": self.components,
+            "explained_variance": self.explained_variance,
+        }
+
+    def project(self, vector: List[float]) -> List[float]:
+        """Reduced, unit-length version of a full query vector"""
+        if self.method == TRUNCATE:
+            return normalise(list(vector[:self.dimensions]))
+        centred = [x - m for x, m in zip(vector, self.mean)]
+        return normalise([sum(c * x for c, x in zip(row, centred)) for row in self.components])
+
+
+def rescore(query_vector: List[float], candidates: List[Dict], field: str, limit: int) -> List[Dict]:
+    """
+    Order first-pass candidates by cosine similarity of their full vectors,
+    scored (1 + cosine) / 2 like Atlas's cosine vectorSearchScore
+    """
+    scored = []
+    for candidate in candidates:
+        if candidate.get(field) is None:
+            continue
+        candidate["score"] = (1 + cosine(query_vector, as_floats(candidate.pop(field)))) / 2
+        scored.append(candidate)
+    scored.sort(key=lambda candidate: candidate["score"], reverse=True)
+    return scored[:limit]
+
+
+def get_projection(meta_collection, version) -> Optional[Projection]:
+    """
+    Projection for this container, reloaded when the collection version
+    changes. A version of None reuses whatever was loaded last.
+    """
+    global _projection, _projection_version, _projection_loaded
+    with _projection_lock:
+        if not _projection_loaded or (version is not None and version != _projection_version):
+            try:
+                document = meta_collection.find_one({"_id": PROJECTION_DOC_ID})
+                _projection = Projection.from_document(document) if document else None
+                _projection_version = version
+                _projection_loaded = True
+                if _projection is not None:
+                    print(f"📉 Loaded {_projection.method} projection v{_projection.version}: "
+                          f"{_projection.dimensions} dimensions")
+            except Exception as e:
+                print(f"❌ Could not load projection: {e}")
+                return None
+        return _projection
@@ -0,0 +1,216 @@
+from collections import Counter
+from retrieval_cache import normalise_query
+from typing import Dict, Iterable, List, Optional, Tuple
+import re
+import threading
+import time
+
+KEYWORD = "keyword"
+SEMANTIC = "semantic"
+BOTH = "both"
+
+# Words that carry no lookup value on their own
+STOPWORDS = {
+    "a", "an", "and", "any", "are", "as", "at", "by", "can", "did", "do", "for", "from", "give",
+    "he", "her", "his", "i", "in", "is", "it", "me", "my", "of", "on", "or", "she", "show",
+    "some", "tell", "that", "the", "their", "them", "there", "they", "this", "to", "was",
+    "what", "which", "who", "with", "you",
+}
+
+# Words that signal a description of a film rather than a name to look up
+CONCEPT_WORDS = {
+    "about", "cartoon", "film", "films", "funny", "genre", "kind", "like", "movie", "movies",
+    "plot", "romantic", "sad", "scary", "similar", "something", "story", "stories", "type",
+    "where",
+}
+
+# A title or name word only points keyword search at a film if it occurs in
+# at most this many titles/names; in a large catalogue common nouns ("dog",
+# "war") are in hundreds of titles and are treated as plain description
+MAX_KEYWORD_DF = 5
+
+# How many documents to read when building the title/cast dictionary, and
+# the longest a background rebuild may spend reading them
+DICTIONARY_LIMIT = 50000
+DICTIONARY_MAX_TIME_MS = 5000
+# After a failed or timed-out build, the next attempt waits this long and
+# runs in the background; requests are routed keyword-first meanwhile
+ROUTER_RETRY_S = 60
+
+_router: Optional["QueryRouter"] = None
+_router_version = None
+_router_building = False
+_router_failed_at: Optional[float] = None
+_router_lock = threading.Lock()
+
+
+class QueryRouter:
+    """
+    Classifies a query as keyword, semantic or both before any I/O, using
+    lexical features and a dictionary of titles and cast/director names.
+    """
+
+    def __init__(self, titles: Iterable[str] = (), names: Iterable[str] = ()):
+        self.phrases = set()
+        for title in titles:
+            phrase = normalise_query(title)
+            if phrase:
+                self.phrases.add(phrase)
+        title_phrases = set(self.phrases)
+        name_phrases = set()
+        for name in names:
+            phrase = normalise_query(name)
+            if phrase:
+                self.phrases.add(phrase)
+                name_phrases.add(phrase)
+        # number of distinct titles/names each word occurs in
+        document_frequency = Counter(token for phrase in self.phrases for token in set(phrase.split()))
+        self.title_tokens = self._distinctive(title_phrases, document_frequency)
+        # a name word that is also a title word ("love", "king") is read as the word
+        title_words = {token for phrase in title_phrases for token in phrase.split()}
+        self.name_tokens = self._distinctive(name_phrases, document_frequency) - title_words
+
+    @staticmethod
+    def _distinctive(phrases, document_frequency) -> set:
+        return {token for phrase in phrases for token in phrase.split()
+                if token not in STOPWORDS and document_frequency[token] <= MAX_KEYWORD_DF}
+
+    @classmethod
+    def from_documents(cls, documents: Iterable[Dict]) -> "QueryRouter":
+        titles, names = [], []
+        for document in documents:
+            if document.get("title"):
+                titles.append(str(document["title"]))
+            for field in ("cast", "directors"):
+                names.extend(str(name) for name in document.get(field) or [])
+        return cls(titles, names)
+
+    @classmethod
+    def from_collection(cls, collection, max_time_ms: int = DICTIONARY_MAX_TIME_MS) -> "QueryRouter":
+        """
+        Dictionary of up to DICTIONARY_LIMIT documents. maxTimeMS only bounds
+        the time spent on the server, so fetching and decoding the batches
+        here is held to the same budget and raises TimeoutError past it.
+        """
+        cursor = collection.find({}, {"_id": 0, "title": 1, "cast": 1, "directors": 1})
+        cursor = cursor.limit(DICTIONARY_LIMIT).max_time_ms(max_time_ms)
+        give_up_at = time.monotonic() + max_time_ms / 1000.0
+
+        def documents():
+            for document in cursor:
+                if time.monotonic() > give_up_at:
+                    raise TimeoutError(f"dictionary read took over {max_time_ms}ms")
+                yield document
+
+        return cls.from_documents(documents())
+
+    def route(self, query: str) -> Tuple[str, str]:
+        """Return (route, reason) for the query"""
+        if re.search(r'"[^"]+"', query):
+            return KEYWORD, "quoted phrase"
+
+        tokens = normalise_query(query).split()
+        if " ".join(tokens) in self.phrases:
+            return KEYWORD, f"matches '{' '.join(tokens)}'"
+        # Any multi-word title or name contained in the query
+        for size in range(len(tokens), 1, -1):
+            for i in range(len(tokens) - size + 1):
+                phrase = " ".join(tokens[i:i + size])
+                if phrase in self.phrases:
+                    return KEYWORD, f"matches '{phrase}'"
+
+        concept = any(token in CONCEPT_WORDS for token in tokens)
+        content = [token for token in tokens if token not in STOPWORDS and token not in CONCEPT_WORDS]
+        if not content:
+            return SEMANTIC, "no lookup terms"
+
+        names = [token for token in content if token in self.name_tokens]
+        # in a description ("movies about a city") title words are just nouns
+        titles = [] if concept else [token for token in content
+                                     if token in self.title_tokens and token not in names]
+        known = names + titles
+        if not known:
+            return SEMANTIC, "no distinctive title or cast terms"
+        # names alone are a lookup even in a description ("chaplin films"); a
+        # single title word alone is too weak to skip the semantic search
+        if len(names) == len(content) or (len(known) == len(content) and len(titles) > 1):
+            return KEYWORD, f"title/cast terms {known}"
+        return BOTH, f"mixed terms {known} of {content}"
+
+
+def _build_router(collection, version, max_time_ms: int) -> Optional[QueryRouter]:
+    global _router, _router_version, _router_building, _router_failed_at
+    router = None
+    try:
+        start = time.perf_counter()
+        router = QueryRouter.from_collection(collection, max_time_ms)
+        print(f"🧭 Query router built in {(time.perf_counter() - start) * 1000:.0f}ms: "
+              f"{len(router.phrases)} phrases")
+    except Exception as e:
+        print(f"❌ Could not build query router: {e}")
+    with _router_lock:
+        if router is not None:
+            _router, _router_version = router, version
+        _router_failed_at = None if router is not None else time.monotonic()
+        _router_building = False
+    return router
+
+
+def get_router(collection, version, max_time_ms: int = DICTIONARY_MAX_TIME_MS) -> Optional[QueryRouter]:
+    """
+    Router for this container. The first call builds it within `max_time_ms`;
+    after that a new collection version rebuilds it on a background thread
+    while the previous router keeps serving. A version of None (unreadable
+    meta collection) keeps the current router. A failed build is retried in
+    the background, at most every ROUTER_RETRY_S. Returns None while no
+    router is available, e.g. when another request is building the first one.
+    """
+    global _router_building
+    with _router_lock:
+        if _router_building or (_router is not None and version in (None, _router_version)):
+            return _router
+        if _router_failed_at is not None and time.monotonic() - _router_failed_at < ROUTER_RETRY_S:
+            return _router
+        _router_building = True
+        current = _router
+        first_attempt = current is None and _router_failed_at is None
+    if first_attempt:
+        return _build_router(collection, version, max_time_ms)
+    threading.Thread(target=_build_router, args=(collection, version, DICTIONARY_MAX_TIME_MS),
+                     name="query-router-build", daemon=True).start()
+    return current
+
+
+def evaluate(router: QueryRouter, labelled: List[Tuple[str, str]], keyword_rtt_ms: float = 30,
+             semantic_ms: float = 100) -> Dict:
+    """
+    Routing accuracy on (query, expected route) pairs, and the latency change
+    compared with always trying keyword search first: SEMANTIC routes save a
+    $search round trip (keyword_rtt_ms), while BOTH routes always pay for an
+    embedding plus $vectorSearch (semantic_ms), even when keyword search alone
+    would have been enough.
+    """
+    correct = 0
+    routed = {KEYWORD: 0, SEMANTIC: 0, BOTH: 0}
+    mistakes = []
+    start = time.perf_counter()
+    for query, expected in labelled:
+        route, reason = router.route(query)
+        routed[route] += 1
+        if route == expected:
+            correct += 1
+        else:
+            mistakes.append((query, expected, route, reason))
+    routing_ms = (time.perf_counter() - start) * 1000
+    return {
+        "queries": len(labelled),
+        "accuracy": round(correct / len(labelled), 3) if labelled else 0.0,
+        "routed": routed,
+        "mistakes": mistakes,
+        "keyword_round_trips_avoided": routed[SEMANTIC],
+        "keyword_latency_saved_ms": routed[SEMANTIC] * keyword_rtt_ms,
+        "semantic_searches_added": routed[BOTH],
+        "semantic_latency_added_ms": routed[BOTH] * semantic_ms,
+        "estimated_latency_saved_ms": routed[SEMANTIC] * keyword_rtt_ms - routed[BOTH] * semantic_ms,
+        "mean_routing_us": round(routing_ms * 1000 / len(labelled), 1) if labelled else 0.0,
+    }
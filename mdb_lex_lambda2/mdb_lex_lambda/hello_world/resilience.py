@@ -0,0 +1,225 @@
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Optional
+import contextvars
+import os
+import threading
+import time
+
+# Breakers and latency windows live at module level so their state carries
+# over between warm invocations of the same container.
+_breakers: Dict[str, "CircuitBreaker"] = {}
+_breakers_lock = threading.Lock()
+_hedge_executor: Optional[ThreadPoolExecutor] = None
+# one pool per endpoint, so slow LLM generations cannot queue up embedding calls
+_timeout_executors: Dict[str, ThreadPoolExecutor] = {}
+_executor_lock = threading.Lock()
+
+FAILURE_THRESHOLD = 3
+RESET_TIMEOUT_S = 30
+HEDGE_MIN_SAMPLES = 20
+# Threads per endpoint for call_with_timeout (TIMEOUT_WORKERS); server mode
+# raises it to the number of request threads
+TIMEOUT_WORKERS = 16
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an endpoint whose breaker is open"""
+
+
+class QueueTimeoutError(TimeoutError):
+    """A call_with_timeout call ran out of time before a worker picked it up; the endpoint was never called"""
+
+
+class LatencyTracker:
+    """Sliding window of call latencies, in milliseconds"""
+
+    def __init__(self, window: int = 100):
+        self.samples = deque(maxlen=window)
+        self.lock = threading.Lock()
+
+    def record(self, latency_ms: float):
+        with self.lock:
+            self.samples.append(latency_ms)
+
+    def percentile(self, p: float) -> Optional[float]:
+        with self.lock:
+            samples = sorted(self.samples)
+        if not samples:
+            return None
+        index = min(int(round(p / 100.0 * (len(samples) - 1))), len(samples) - 1)
+        return samples[index]
+
+    def __len__(self):
+        return len(self.samples)
+
+
+class CircuitBreaker:
+    """Closed -> open after consecutive failures -> half-open probe after a cool-down"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = FAILURE_THRESHOLD,
+                 reset_timeout_s: float = RESET_TIMEOUT_S, clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_s = reset_timeout_s
+        self.clock = clock
+        self.latencies = LatencyTracker()
+        self.lock = threading.Lock()
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.consecutive_failures = 0
+        self.counters = {"successes": 0, "failures": 0, "short_circuits": 0,
+                         "opened": 0, "hedges": 0}
+
+    @property
+    def state(self) -> str:
+        with self.lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == self.OPEN and self.clock() - self._opened_at >= self.reset_timeout_s:
+            self._state = self.HALF_OPEN
+            self._probe_in_flight = False
+        return self._state
+
+    def available(self) -> bool:
+        """True if a call now would reach the endpoint: closed, or half-open with no probe in flight"""
+        with self.lock:
+            state = self._current_state()
+            return state == self.CLOSED or (state == self.HALF_OPEN and not self._probe_in_flight)
+
+    def allow_request(self) -> bool:
+        """True if a call may go to the endpoint; half-open lets one probe through"""
+        with self.lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self.counters["short_circuits"] += 1
+            return False
+
+    def record_success(self, latency_ms: Optional[float] = None):
+        with self.lock:
+            self.counters["successes"] += 1
+            self.consecutive_failures = 0
+            self._state = self.CLOSED
+            self._probe_in_flight = False
+        if latency_ms is not None:
+            self.latencies.record(latency_ms)
+
+    def record_failure(self):
+        with self.lock:
+            self.counters["failures"] += 1
+            self.consecutive_failures += 1
+            state = self._current_state()
+            if state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if state != self.OPEN:
+                    self.counters["opened"] += 1
+                    print(f"⚠️ Circuit '{self.name}' opened after {self.consecutive_failures} failures")
+                self._state = self.OPEN
+                self._opened_at = self.clock()
+            self._probe_in_flight = False
+
+    def call(self, fn: Callable, *args, **kwargs):
+        """Run `fn` through the breaker, raising CircuitOpenError while it is open"""
+        if not self.allow_request():
+            raise CircuitOpenError(f"{self.name} endpoint circuit is {self.state}")
+        start = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except QueueTimeoutError:
+            # says nothing about the endpoint's health
+            with self.lock:
+                self._probe_in_flight = False
+            raise
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success((time.perf_counter() - start) * 1000)
+        return result
+
+    def metrics(self) -> Dict:
+        p50 = self.latencies.percentile(50)
+        p95 = self.latencies.percentile(95)
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            **self.counters,
+            "p50_ms": round(p50, 1) if p50 is not None else None,
+            "p95_ms": round(p95, 1) if p95 is not None else None,
+        }
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """Breaker for the named endpoint, shared by all requests in this container"""
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
+
+
+def breaker_metrics() -> Dict[str, Dict]:
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.metrics() for breaker in breakers}
+
+
+def hedged_call(fn: Callable, *args, breaker: CircuitBreaker, percentile: float = 95):
+    """
+    Call `fn`, and if it has not answered within the breaker's p`percentile`
+    latency, send a second identical request and return whichever finishes
+    first. Hedging only starts once HEDGE_MIN_SAMPLES latencies are known.
+    """
+    global _hedge_executor
+    if len(breaker.latencies) < HEDGE_MIN_SAMPLES:
+        return fn(*args)
+    delay_s = breaker.latencies.percentile(percentile) / 1000.0
+    with _executor_lock:
+        if _hedge_executor is None:
+            _hedge_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="hedge")
+
+    futures = [_hedge_executor.submit(fn, *args)]
+    done, _ = wait(futures, timeout=delay_s)
+    if not done:
+        with breaker.lock:
+            breaker.counters["hedges"] += 1
+        futures.append(_hedge_executor.submit(fn, *args))
+
+    pending = set(futures)
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+            error = future.exception()
+    raise error
+
+
+def call_with_timeout(fn: Callable, *args, timeout_ms: float, pool: str = "endpoint"):
+    """
+    Call `fn` on a worker thread of the named pool and raise TimeoutError if
+    it has not answered within `timeout_ms`. The abandoned call is not
+    cancelled; it runs on until the client's own read timeout. A call that is
+    still queued when time runs out is dropped with QueueTimeoutError. The
+    caller's context (deadline, session) is carried over to the worker.
+    """
+    with _executor_lock:
+        executor = _timeout_executors.get(pool)
+        if executor is None:
+            executor = _timeout_executors[pool] = ThreadPoolExecutor(
+                max_workers=int(os.environ.get("TIMEOUT_WORKERS", TIMEOUT_WORKERS)), thread_name_prefix=pool)
+    future = executor.submit(contextvars.copy_context().run, fn, *args)
+    done, _ = wait([future], timeout=timeout_ms / 1000.0)
+    if not done:
+        if future.cancel():
+            raise QueueTimeoutError(f"no {pool} worker free within {timeout_ms:.0f}ms")
+        raise TimeoutError(f"no answer within {timeout_ms:.0f}ms")
+    return future.result()
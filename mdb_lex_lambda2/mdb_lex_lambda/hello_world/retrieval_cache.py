@@ -0,0 +1,125 @@
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import os
+import re
+import threading
+import time
+
+# Document in the metadata collection whose counter is bumped by the embedding
+# pipeline on every write to the movies collection.
+VERSION_DOC_ID = "version"
+
+# Seconds a container keeps using the version token it last read
+# (VERSION_TTL_S). A write therefore takes up to this long to invalidate
+# cached results and reload the query router and projection, in exchange
+# for not reading the meta collection on every request.
+VERSION_TTL_S = 5
+
+_cache: Optional["RetrievalCache"] = None
+_version: Optional[Tuple[Any, float]] = None
+_version_lock = threading.Lock()
+_clock = time.monotonic
+
+# (_id, score, search_type, passage _ids) for each ranked result; the passage
+# _ids are empty unless the result came from the passage index
+CachedHit = Tuple[Any, float, str, Tuple]
+
+
+def bump_collection_version(meta_collection):
+    """
+    Called by every writer after it changes the movies collection: invalidates
+    cached retrieval results and makes warm containers reload the query router
+    and projection built for the previous version.
+    """
+    meta_collection.update_one({"_id": VERSION_DOC_ID}, {"$inc": {"version": 1}}, upsert=True)
+
+
+def collection_version(meta_collection, max_time_ms: int):
+    """Version token for this container, re-read once it is VERSION_TTL_S old"""
+    global _version
+    now = _clock()
+    with _version_lock:
+        if _version is not None and now - _version[1] < float(os.environ.get("VERSION_TTL_S", VERSION_TTL_S)):
+            return _version[0]
+    meta = meta_collection.find_one({"_id": VERSION_DOC_ID}, max_time_ms=max_time_ms)
+    version = meta.get("version", 0) if meta else 0
+    with _version_lock:
+        _version = (version, now)
+    return version
+
+
+def normalise_query(query: str) -> str:
+    """Lower-case, strip punctuation and collapse whitespace"""
+    return " ".join(re.sub(r"[^\w\s]", " ", query.lower()).split())
+
+
+class RetrievalCache:
+    """
+    LRU map from (normalised query, k, mode) to ranked hits, tagged with a
+    collection version. The query embedding is kept with the hits so Lex
+    SIMILAR follow-ups still have a vector after a cache hit.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[Tuple, Tuple[Any, List[CachedHit], Optional[array]]]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "stale": 0, "evictions": 0}
+
+    @staticmethod
+    def key(query: str, k: int, mode: str) -> Tuple[str, int, str]:
+        return (normalise_query(query), k, mode)
+
+    def get(self, key: Tuple, version: Any) -> Optional[List[CachedHit]]:
+        """Cached hits for `key`, or None if absent or computed against another version"""
+        entry = self.get_entry(key, version)
+        return entry[0] if entry is not None else None
+
+    def get_entry(self, key: Tuple, version: Any) -> Optional[Tuple[List[CachedHit], Optional[List[float]]]]:
+        """Cached hits for `key` and the query vector they were ranked with, if any"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.counters["misses"] += 1
+                return None
+            entry_version, hits, query_vector = entry
+            if entry_version != version:
+                del self.entries[key]
+                self.counters["stale"] += 1
+                self.counters["misses"] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.counters["hits"] += 1
+            return list(hits), query_vector.tolist() if query_vector is not None else None
+
+    def put(self, key: Tuple, version: Any, hits: List[CachedHit], query_vector: Optional[List[float]] = None):
+        # the vector is kept as float32, about a sixth of the size of a list of floats
+        vector = array("f", query_vector) if query_vector else None
+        with self.lock:
+            self.entries[key] = (version, list(hits), vector)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.counters["evictions"] += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def metrics(self) -> Dict:
+        with self.lock:
+            lookups = self.counters["hits"] + self.counters["misses"]
+            return {
+                **self.counters,
+                "size": len(self.entries),
+                "hit_rate": round(self.counters["hits"] / lookups, 3) if lookups else 0.0,
+            }
+
+
+def get_retrieval_cache() -> RetrievalCache:
+    """Cache shared by all requests in this container (RETRIEVAL_CACHE_SIZE entries)"""
+    global _cache
+    if _cache is None:
+        _cache = RetrievalCache(max_entries=int(os.environ.get("RETRIEVAL_CACHE_SIZE", "256")))
+    return _cache
@@ -0,0 +1,225 @@
+"""
+Long-running HTTP server for the Lex chain, as an alternative to one Lambda
+invocation per request.
+
+The same chain, retriever, caches, circuit breakers and client connection
+pools are shared by every request in the process, and query embeddings from
+concurrent requests are coalesced into batched endpoint calls. Requests take
+the Lex event that Lambda would receive and return the Lex response:
+
+    POST /lex     Lex V2 event (inputTranscript, sessionState) -> Lex response
+    GET  /health  endpoint health, retrieval cache and embedding batch metrics
+
+`application` is a plain ASGI app (uvicorn server:application); running this
+file serves it with a small asyncio HTTP/1.1 server instead:
+
+    python server.py --port 8080
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from typing import Any, Dict, Optional, Tuple
+
+import app as lex_app
+from embedding_batcher import BATCH_WINDOW_MS, MAX_BATCH_SIZE, EmbeddingBatcher
+from langchain_mongodb import get_chain
+from resilience import breaker_metrics
+from retrieval_cache import get_retrieval_cache
+
+# Per-request budget, the same as the Lambda function timeout in template.yaml
+REQUEST_TIMEOUT_S = 30
+# Requests run the synchronous chain on this many threads
+SERVER_WORKERS = 32
+MAX_BODY_BYTES = 1 << 20
+
+_batcher: Optional[EmbeddingBatcher] = None
+_started = False
+_start_lock = threading.Lock()
+
+
+class RequestContext:
+    """Lambda-style context so each request gets its own deadline"""
+
+    def __init__(self, timeout_s: float, clock=time.monotonic):
+        self.clock = clock
+        self.expires_at = clock() + timeout_s
+
+    def get_remaining_time_in_millis(self) -> int:
+        return int((self.expires_at - self.clock()) * 1000)
+
+
+def start():
+    """Build the shared chain and put the embedding batcher in front of its endpoint"""
+    global _batcher, _started
+    with _start_lock:
+        # every request thread may be waiting on a SageMaker endpoint at once
+        workers = os.environ.get("SERVER_WORKERS", str(SERVER_WORKERS))
+        os.environ.setdefault("SAGEMAKER_MAX_POOL_CONNECTIONS", workers)
+        os.environ.setdefault("TIMEOUT_WORKERS", workers)
+        chain = get_chain()
+        retriever = getattr(chain, "retriever", None)
+        if _batcher is None and retriever is not None:
+            _batcher = EmbeddingBatcher(
+                retriever.query_embeddings,
+                window_ms=float(os.environ.get("EMBEDDING_BATCH_WINDOW_MS", BATCH_WINDOW_MS)),
+                max_batch=int(os.environ.get("EMBEDDING_MAX_BATCH", MAX_BATCH_SIZE)))
+            retriever.embeddings = _batcher
+        _started = True
+        return chain
+
+
+def stop():
+    global _batcher, _started
+    with _start_lock:
+        if _batcher is not None:
+            _batcher.close()
+            _batcher = None
+        _started = False
+
+
+def metrics() -> Dict[str, Any]:
+    return {
+        "endpoints": breaker_metrics(),
+        "retrieval_cache": get_retrieval_cache().metrics(),
+        "embedding_batches": _batcher.metrics() if _batcher is not None else None,
+    }
+
+
+async def startup():
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(
+        max_workers=int(os.environ.get("SERVER_WORKERS", SERVER_WORKERS)), thread_name_prefix="lex-request"))
+    await asyncio.to_thread(start)
+    print(f"🚀 Lex server ready: {json.dumps(metrics())}")
+
+
+async def handle(method: str, path: str, body: bytes) -> Tuple[int, Dict[str, Any]]:
+    """Route one request; returns (status, JSON payload)"""
+    if path == "/health" and method == "GET":
+        return 200, metrics()
+    if path not in ("/", "/lex"):
+        return 404, {"error": "not found"}
+    if method != "POST":
+        return 405, {"error": "use POST with a Lex event"}
+    if len(body) > MAX_BODY_BYTES:
+        return 413, {"error": "request body too large"}
+    try:
+        event = json.loads(body)
+    except ValueError:
+        return 400, {"error": "request body is not JSON"}
+    if not isinstance(event, dict) or not isinstance(event.get("inputTranscript"), str):
+        return 400, {"error": "expected a Lex event with inputTranscript"}
+
+    # the deadline starts now, so time spent queued for a worker counts against it
+    context = RequestContext(float(os.environ.get("REQUEST_TIMEOUT_S", REQUEST_TIMEOUT_S)))
+    try:
+        if not _started:
+            # ASGI servers run without lifespan events unless asked to
+            await asyncio.to_thread(start)
+        # to_thread copies the context, keeping each request's deadline and session separate
+        return 200, await asyncio.to_thread(lex_app.lambda_handler, event, context)
+    except Exception as e:
+        print(f"❌ Request failed: {e}")
+        return 500, {"error": "internal error"}
+
+
+async def application(scope, receive, send):
+    """ASGI entry point"""
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await startup()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await asyncio.to_thread(stop)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    if scope["type"] != "http":
+        return
+
+    body = b""
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if len(body) > MAX_BODY_BYTES:
+            break
+
+    status, payload = await handle(scope["method"], scope["path"], body)
+    data = json.dumps(payload).encode("utf-8")
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json"),
+                            (b"content-length", str(len(data)).encode("ascii"))]})
+    await send({"type": "http.response.body", "body": data})
+
+
+async def _connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """Serve HTTP/1.1 requests on one keep-alive connection"""
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            method, target, version = request_line.decode("latin-1").split()
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+
+            length = int(headers.get("content-length", "0"))
+            if length > MAX_BODY_BYTES:
+                status, payload = 413, {"error": "request body too large"}
+                keep_alive = False
+            else:
+                body = await reader.readexactly(length) if length else b""
+                status, payload = await handle(method, target.split("?", 1)[0], body)
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+
+            data = json.dumps(payload).encode("utf-8")
+            writer.write((f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+                          f"Content-Type: application/json\r\n"
+                          f"Content-Length: {len(data)}\r\n"
+                          f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n").encode("latin-1") + data)
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(host: str = "127.0.0.1", port: int = 8080, ready: Optional[asyncio.Event] = None):
+    await startup()
+    server = await asyncio.start_server(_connection, host, port)
+    print(f"Listening on http://{host}:{port}")
+    if ready is not None:
+        ready.set()
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await asyncio.to_thread(stop)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the Lex chain over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
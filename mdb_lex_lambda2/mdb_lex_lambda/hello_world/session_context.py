@@ -0,0 +1,121 @@
+from array import array
+from contextlib import contextmanager
+from contextvars import ContextVar
+from query_router import STOPWORDS
+from retrieval_cache import normalise_query
+from typing import Dict, List, Optional
+import base64
+import json
+
+# Lex session attribute names; values must be strings
+IDS_ATTRIBUTE = "mdbRetrievedIds"
+VECTOR_ATTRIBUTE = "mdbQueryVector"
+STATS_ATTRIBUTE = "mdbRetrievalStats"
+PASSAGES_ATTRIBUTE = "mdbPassageIds"
+
+# Words that refer back to something from the previous turn
+REFERRING_WORDS = {"it", "its", "that", "this", "these", "those", "they", "them", "their",
+                   "he", "him", "his", "she", "her"}
+SIMILAR_WORDS = {"similar", "another", "more", "others", "else"}
+
+# A follow-up that brings more new terms than this is treated as a new question
+MAX_FOLLOW_UP_TERMS = 2
+# Candidate ids kept in the session, most recent last
+MAX_SESSION_IDS = 20
+
+RERANK = "rerank"
+SIMILAR = "similar"
+
+_current_session: ContextVar[Optional["SessionContext"]] = ContextVar("session", default=None)
+
+
+def encode_vector(vector: List[float]) -> str:
+    """Pack a vector as base64 float32, about a third the size of JSON"""
+    return base64.b64encode(array("f", vector).tobytes()).decode("ascii")
+
+
+def decode_vector(encoded: str) -> List[float]:
+    values = array("f")
+    values.frombytes(base64.b64decode(encoded))
+    return values.tolist()
+
+
+class SessionContext:
+    """Retrieval state carried between turns of one Lex session"""
+
+    def __init__(self, ids: Optional[List[str]] = None, query_vector: Optional[List[float]] = None,
+                 stats: Optional[Dict[str, int]] = None, passages: Optional[Dict[str, List[str]]] = None):
+        self.ids = ids or []
+        self.query_vector = query_vector
+        # passage-mode results: doc id -> ids of the passages that were returned for it
+        self.passages = passages or {}
+        self.stats = {"turns": 0, "retrievals": 0, "retrievals_avoided": 0, "embeddings_avoided": 0,
+                      **(stats or {})}
+
+    @classmethod
+    def from_lex(cls, session_attributes: Optional[Dict[str, str]]) -> "SessionContext":
+        attributes = session_attributes or {}
+        try:
+            ids = json.loads(attributes.get(IDS_ATTRIBUTE, "[]"))
+            vector = decode_vector(attributes[VECTOR_ATTRIBUTE]) if attributes.get(VECTOR_ATTRIBUTE) else None
+            stats = json.loads(attributes.get(STATS_ATTRIBUTE, "{}"))
+            passages = json.loads(attributes.get(PASSAGES_ATTRIBUTE, "{}"))
+        except (ValueError, TypeError) as e:
+            print(f"❌ Ignoring unreadable session attributes: {e}")
+            return cls()
+        return cls(ids, vector, stats, passages)
+
+    def to_lex(self, session_attributes: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+        """Merge this state into the session attributes returned to Lex"""
+        attributes = dict(session_attributes or {})
+        attributes[IDS_ATTRIBUTE] = json.dumps(self.ids)
+        attributes[STATS_ATTRIBUTE] = json.dumps(self.stats)
+        if self.query_vector:
+            attributes[VECTOR_ATTRIBUTE] = encode_vector(self.query_vector)
+        else:
+            attributes.pop(VECTOR_ATTRIBUTE, None)
+        if self.passages:
+            attributes[PASSAGES_ATTRIBUTE] = json.dumps(self.passages)
+        else:
+            attributes.pop(PASSAGES_ATTRIBUTE, None)
+        return attributes
+
+    def follow_up_kind(self, query: str) -> Optional[str]:
+        """RERANK or SIMILAR if the query refers back to the last results, else None"""
+        if not self.ids:
+            return None
+        tokens = normalise_query(query).split()
+        if not any(token in REFERRING_WORDS for token in tokens):
+            return None
+        if any(token in SIMILAR_WORDS for token in tokens):
+            return SIMILAR
+        new_terms = [token for token in tokens
+                     if token not in STOPWORDS and token not in REFERRING_WORDS and token not in SIMILAR_WORDS]
+        return RERANK if len(new_terms) <= MAX_FOLLOW_UP_TERMS else None
+
+    def remember(self, doc_ids: List[str], query_vector: Optional[List[float]],
+                 passages: Optional[Dict[str, List[str]]] = None):
+        """Keep this turn's results, and their passage ids, as the candidates for the next one"""
+        self.ids = list(doc_ids)[-MAX_SESSION_IDS:]
+        self.query_vector = query_vector
+        self.passages = {doc_id: list(passages[doc_id]) for doc_id in self.ids if (passages or {}).get(doc_id)}
+
+    def record(self, retrieved: bool, embedding_avoided: bool = False):
+        self.stats["turns"] += 1
+        self.stats["retrievals" if retrieved else "retrievals_avoided"] += 1
+        if embedding_avoided:
+            self.stats["embeddings_avoided"] += 1
+
+
+def current_session() -> Optional[SessionContext]:
+    """Session of the request being handled, or None outside a Lex session"""
+    return _current_session.get()
+
+
+@contextmanager
+def session_scope(session: Optional[SessionContext]):
+    token = _current_session.set(session)
+    try:
+        yield session
+    finally:
+        _current_session.reset(token)
@@ -3,7 +3,55 @@ warnings.filterwarnings("ignore")
 
 import time
 import os
-from mongodb_retriever import MDBContextRetriever
+from mongodb_retriever import MDBContextRetriever, get_settings
+from query_router import QueryRouter, evaluate
+
+# Queries labelled with the route the query router should pick
+ROUTING_QUERIES = [
+    # titles, cast and directors
+    ("Robin Hood", "keyword"),
+    ("Buster Keaton", "keyword"),
+    ("train robbery", "keyword"),
+    ("who starred in modern times", "keyword"),
+    ('"One Week"', "keyword"),
+    ("Charles Chaplin", "keyword"),
+    ("Dracula", "keyword"),
+    ("Steamboat Willie", "keyword"),
+    ("Greta Garbo", "keyword"),
+    ("Top Hat", "keyword"),
+    ("movies with Buster Keaton", "keyword"),
+    ("the four horsemen of the apocalypse", "keyword"),
+    ("keaton", "keyword"),
+    ("chaplin films", "keyword"),
+    ("marlene dietrich in morocco", "keyword"),
+    ("john ford westerns", "keyword"),
+    ("city lights", "keyword"),
+    ("gold diggers", "keyword"),
+    # descriptions, including ones built from common title words
+    ("wordless humor", "semantic"),
+    ("xylophone zebra quantum", "semantic"),
+    ("adventure story", "semantic"),
+    ("funny movie", "semantic"),
+    ("animated cartoon", "semantic"),
+    ("biblical story", "semantic"),
+    ("a dog who saves his family", "semantic"),
+    ("war horses", "semantic"),
+    ("stories about loneliness in a big city", "semantic"),
+    ("a tramp in a factory", "semantic"),
+    ("a woman disguised as a man", "semantic"),
+    ("gangsters during prohibition", "semantic"),
+    ("sad love story", "semantic"),
+    ("a musical on a ship", "semantic"),
+    ("pirates and sword fights", "semantic"),
+    ("a king and his queen", "semantic"),
+    # descriptions that name something a title also has
+    ("clown performance", "both"),
+    ("dinosaur animation", "both"),
+    ("silent comedy with a train chase", "both"),
+    ("ghost in a scottish castle", "both"),
+    ("jungle adventure with an ape", "both"),
+    ("opera singers", "both"),
+]
 
 def run_test_suite():
     """Run comprehensive test suite for hybrid search"""
@@ -32,12 +80,13 @@ def run_test_suite():
     ]
     
     # Initialize retriever
+    get_settings()
     mongodb_uri = os.environ["ATLAS_URI"]
     retriever = MDBContextRetriever(mongodb_uri=mongodb_uri, k=3)
     
     print(f"\n🔧 TESTING SEARCH METHOD DETECTION:")
-    print(f"If all queries return KEYWORD results, your text index is too broad.")
-    print(f"Semantic search only triggers when keyword search returns 0 results.")
+    print(f"The query router sends title/cast lookups to keyword search and")
+    print(f"descriptive queries straight to semantic search.")
     print(f"The last test uses nonsense words to guarantee semantic search.\n")
     
     print(f"{'='*100}")
@@ -110,8 +159,43 @@ def run_test_suite():
     print(f"• Simple search is the fallback when others fail")
     print(f"• Hybrid approach optimizes for both speed and accuracy")
 
+def run_routing_report():
+    """Report query router accuracy and the keyword round trips it saves"""
+    get_settings()
+    mongodb_uri = os.environ["ATLAS_URI"]
+    retriever = MDBContextRetriever(mongodb_uri=mongodb_uri, k=3)
+
+    # Measure the keyword round trip the router avoids for semantic queries
+    start_time = time.time()
+    retriever._keyword_search("xylophone zebra quantum")
+    keyword_rtt_ms = (time.time() - start_time) * 1000
+
+    # ...and the embedding + $vectorSearch that BOTH routes always add
+    start_time = time.time()
+    retriever._vector_search(retriever._embed_query("xylophone zebra quantum"))
+    semantic_ms = (time.time() - start_time) * 1000
+
+    router = QueryRouter.from_collection(retriever.collection)
+    report = evaluate(router, ROUTING_QUERIES, keyword_rtt_ms=keyword_rtt_ms, semantic_ms=semantic_ms)
+
+    print(f"{'='*80}")
+    print(f"🧭 QUERY ROUTING REPORT")
+    print(f"{'='*80}")
+    print(f"Queries: {report['queries']}")
+    print(f"Accuracy: {report['accuracy']*100:.1f}%")
+    print(f"Routed: {report['routed']}")
+    print(f"Mean routing time: {report['mean_routing_us']:.1f}µs")
+    print(f"Keyword round trips avoided: {report['keyword_round_trips_avoided']} "
+          f"(~{report['keyword_latency_saved_ms']:.0f}ms at {keyword_rtt_ms:.1f}ms each)")
+    print(f"Semantic searches added by BOTH routes: {report['semantic_searches_added']} "
+          f"(~{report['semantic_latency_added_ms']:.0f}ms at {semantic_ms:.1f}ms each)")
+    print(f"Net latency saved: ~{report['estimated_latency_saved_ms']:.0f}ms")
+    for query, expected, route, reason in report["mistakes"]:
+        print(f"  ❌ '{query}': expected {expected}, routed {route} ({reason})")
+
 def run_single_test(query):
     """Run a single test query"""
+    get_settings()
     mongodb_uri = os.environ["ATLAS_URI"]
     retriever = MDBContextRetriever(mongodb_uri=mongodb_uri, k=3)
     
@@ -142,10 +226,12 @@ def run_single_test(query):
 
 if __name__ == "__main__":
     # Choose test mode
-    TEST_MODE = "full"  # Change to "single" to run just one test
+    TEST_MODE = "full"  # Change to "single" to run just one test, or "routing"
     
     if TEST_MODE == "full":
         run_test_suite()
+    elif TEST_MODE == "routing":
+        run_routing_report()
     else:
         # Test single query - change this to test different prompts
         test_query = "Robin Hood"  # Try: "adventure story", "clown performance", etc.
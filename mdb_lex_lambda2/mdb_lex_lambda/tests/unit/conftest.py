@@ -0,0 +1,54 @@
+import os
+import sys
+
+import pytest
+
+# The Lambda code lives in hello_world/ and imports its modules top-level
+# (CodeUri: hello_world/ in template.yaml), so make them importable here too.
+HELLO_WORLD_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "hello_world")
+sys.path.insert(0, os.path.abspath(HELLO_WORLD_DIR))
+# Offline tools (loaders, exporters) live in util/
+UTIL_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "util")
+sys.path.insert(0, os.path.abspath(UTIL_DIR))
+
+
+@pytest.fixture()
+def hello_world_dir():
+    """ Directory holding the Lambda function code """
+    return os.path.abspath(HELLO_WORLD_DIR)
+
+
+@pytest.fixture()
+def lambda_env(monkeypatch):
+    """ Settings normally provided by template.yaml """
+    import mongodb_retriever
+    import projection
+    import query_router
+    import resilience
+    import retrieval_cache
+
+    for name, value in {
+        "AWS_LAMBDA_FUNCTION_NAME": "unit-test",
+        "ATLAS_URI": "mongodb://localhost:1",
+        "MONGO_DB": "sample_mflix",
+        "MONGO_COLLECTION": "movies",
+        "MONGO_INDEX": "vector-index",
+        "AWS_REGION1": "us-east-1",
+        "EMBEDDING_ENDPOINT_NAME": "embedding-endpoint",
+        "VECTORIZED_FIELD_NAME": "egVector",
+    }.items():
+        monkeypatch.setenv(name, value)
+    monkeypatch.setattr(mongodb_retriever, "_settings", None)
+    monkeypatch.setattr(resilience, "_breakers", {})
+    monkeypatch.setattr(retrieval_cache, "_cache", None)
+    monkeypatch.setattr(retrieval_cache, "_version", None)
+    monkeypatch.setattr(query_router, "_router", None)
+    monkeypatch.setattr(query_router, "_router_building", False)
+    monkeypatch.setattr(query_router, "_router_failed_at", None)
+    monkeypatch.setattr(projection, "_projection", None)
+    monkeypatch.setattr(projection, "_projection_loaded", False)
+    monkeypatch.setattr(resilience, "_timeout_executors", {})
+    # server.start() sets defaults for these; put them back afterwards
+    for name in ("SAGEMAKER_MAX_POOL_CONNECTIONS", "TIMEOUT_WORKERS"):
+        monkeypatch.setenv(name, "")
+        monkeypatch.delenv(name)
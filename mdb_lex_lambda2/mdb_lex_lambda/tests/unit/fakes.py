@@ -0,0 +1,147 @@
+"""
+In-memory stand-ins for the Atlas collection and the SageMaker endpoints, used
+to exercise the retriever and chain without any network access. Each fake can
+advance a FakeClock to simulate the latency of the call it replaces.
+"""
+
+from types import SimpleNamespace
+
+
+class FakeClock:
+    """Monotonic clock that only moves when told to"""
+
+    def __init__(self, start=1000.0):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+    def advance_ms(self, ms):
+        self.now += ms / 1000.0
+
+
+class FakeCursor:
+    def __init__(self, docs, collection):
+        self.docs = list(docs)
+        self.collection = collection
+
+    def limit(self, n):
+        self.docs = self.docs[:n]
+        return self
+
+    def max_time_ms(self, ms):
+        self.collection.max_time_ms.append(ms)
+        return self
+
+    def __iter__(self):
+        return iter(self.docs)
+
+
+class FakeCollection:
+    """Answers $search/$vectorSearch pipelines and find() from canned documents"""
+
+    def __init__(self, docs=(), keyword_hits=(), vector_hits=(), clock=None, latency_ms=0):
+        self.docs = list(docs)
+        self.keyword_hits = list(keyword_hits)
+        self.vector_hits = list(vector_hits)
+        self.clock = clock
+        self.latency_ms = latency_ms
+        self.pipelines = []
+        self.finds = []
+        self.max_time_ms = []
+
+    def _tick(self):
+        if self.clock is not None:
+            self.clock.advance_ms(self.latency_ms)
+
+    def estimated_document_count(self, **kwargs):
+        self._tick()
+        self.max_time_ms.append(kwargs.get("maxTimeMS"))
+        return len(self.docs)
+
+    def count_documents(self, filter, **kwargs):
+        return self.estimated_document_count(**kwargs)
+
+    def aggregate(self, pipeline, **kwargs):
+        self._tick()
+        self.pipelines.append(pipeline)
+        self.max_time_ms.append(kwargs.get("maxTimeMS"))
+        stage = pipeline[0]
+        if "$search" in stage:
+            return iter(self.keyword_hits)
+        if "$vectorSearch" in stage:
+            return iter(self.vector_hits[:stage["$vectorSearch"]["limit"]])
+        return iter([])
+
+    def find(self, filter=None, projection=None, **kwargs):
+        self._tick()
+        self.finds.append(filter)
+        docs = self.docs
+        ids = (filter or {}).get("_id")
+        if isinstance(ids, dict) and "$in" in ids:
+            docs = [doc for doc in docs if doc["_id"] in ids["$in"]]
+        elif ids is not None:
+            docs = [doc for doc in docs if doc["_id"] == ids]
+        return FakeCursor(docs, self)
+
+    def find_one(self, filter=None, projection=None, **kwargs):
+        return next(iter(self.find(filter, projection)), None)
+
+    def update_one(self, filter, update, upsert=False):
+        doc = self.find_one(filter)
+        if doc is None:
+            if not upsert:
+                return
+            doc = dict(filter)
+            self.docs.append(doc)
+        for field, value in update.get("$set", {}).items():
+            doc[field] = value
+        for field, value in update.get("$inc", {}).items():
+            doc[field] = doc.get(field, 0) + value
+
+
+class MongomockBulkWrite:
+    """mongomock's bulk_write does not accept the UpdateOne built by current pymongo"""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+    def bulk_write(self, requests, ordered=True):
+        matched = sum(self.collection.update_one(request._filter, request._doc).matched_count
+                      for request in requests)
+        return SimpleNamespace(matched_count=matched)
+
+
+class FakeEmbeddings:
+    def __init__(self, vector=None, clock=None, latency_ms=0):
+        self.vector = vector or [0.1] * 384
+        self.clock = clock
+        self.latency_ms = latency_ms
+        self.calls = []
+
+    def embed_query(self, text):
+        if self.clock is not None:
+            self.clock.advance_ms(self.latency_ms)
+        self.calls.append(text)
+        return list(self.vector)
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+
+def movie(title, fullplot="", **fields):
+    return {"_id": title.lower().replace(" ", "-"), "title": title, "fullplot": fullplot, **fields}
+
+
+def make_retriever(collection, embeddings=None, version=1, k=2):
+    """MDBContextRetriever wired to fakes; needs the lambda_env fixture"""
+    from mongodb_retriever import MDBContextRetriever
+
+    retriever = MDBContextRetriever(mongodb_uri="mongodb://localhost:1", k=k,
+                                    embeddings=embeddings or FakeEmbeddings())
+    retriever.collection = collection
+    retriever.meta_collection = FakeCollection(docs=[{"_id": "version", "version": version}])
+    return retriever
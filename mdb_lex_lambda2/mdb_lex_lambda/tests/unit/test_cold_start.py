@@ -0,0 +1,56 @@
+import os
+import subprocess
+import sys
+
+"""
+Import-time profile of the Lambda handler module, in the style of
+`python -X importtime`. Importing `app` must stay cheap: settings, clients and
+the heavy LangChain/boto3 modules are only loaded on the first invocation.
+"""
+
+# Modules that must not be imported until a request actually needs them
+DEFERRED_MODULES = [
+    "boto3",
+    "botocore",
+    "dotenv",
+    "langchain.chains",
+    "langchain_aws",
+    "langchain_community",
+]
+
+
+def import_time_profile(module, cwd):
+    """Import `module` in a fresh interpreter and parse the -X importtime report"""
+    env = {k: v for k, v in os.environ.items()
+           if k not in ("MONGO_DB", "AWS_REGION1", "EMBEDDING_ENDPOINT_NAME",
+                        "MONGO_COLLECTION", "MONGO_INDEX", "ATLAS_URI")}
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=cwd,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    assert proc.returncode == 0, proc.stderr
+
+    profile = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        profile[name.strip()] = (int(self_us), int(cumulative_us))
+    return profile
+
+
+def test_app_import_defers_heavy_modules(hello_world_dir):
+    profile = import_time_profile("app", hello_world_dir)
+
+    top = sorted(profile.items(), key=lambda item: item[1][1], reverse=True)[:10]
+    print(f"\nImport time report for 'app' ({len(profile)} modules):")
+    for name, (self_us, cumulative_us) in top:
+        print(f"  {cumulative_us / 1000:8.1f} ms cumulative  {self_us / 1000:7.1f} ms self  {name}")
+
+    assert "app" in profile
+    for module in DEFERRED_MODULES:
+        loaded = [name for name in profile if name == module or name.startswith(module + ".")]
+        assert not loaded, f"{module} is imported at cold start: {loaded[:5]}"
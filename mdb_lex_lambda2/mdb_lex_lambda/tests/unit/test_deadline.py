@@ -0,0 +1,135 @@
+from types import SimpleNamespace
+
+import pytest
+
+from .fakes import FakeClock, FakeCollection, FakeEmbeddings, make_retriever, movie
+
+
+@pytest.fixture()
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture()
+def retriever(lambda_env, clock):
+    collection = FakeCollection(
+        docs=[movie("The Great Train Robbery", "Outlaws hold up a train.")],
+        vector_hits=[dict(movie("The Great Train Robbery", "Outlaws hold up a train."), score=0.9)],
+        clock=clock,
+        latency_ms=200,
+    )
+    retriever = make_retriever(collection, FakeEmbeddings(clock=clock, latency_ms=400))
+    # keyword search first, then semantic, as without a query router
+    retriever.query_routing = False
+    return retriever
+
+
+def test_deadline_from_lambda_context(clock):
+    from deadline import Deadline
+
+    context = SimpleNamespace(get_remaining_time_in_millis=lambda: 30000)
+    deadline = Deadline.from_context(context, reserve_ms=500, clock=clock)
+
+    assert deadline.remaining_ms() == pytest.approx(29500)
+    assert deadline.timeout_ms(2000) == 2000
+    clock.advance_ms(29000)
+    assert deadline.timeout_ms(2000) == 500
+    assert not deadline.allows(501)
+    clock.advance_ms(1000)
+    assert deadline.remaining_ms() == 0
+    assert Deadline.from_context(None) is None
+
+
+def test_retriever_caps_stage_timeouts_to_deadline(retriever, clock):
+    from deadline import Deadline, deadline_scope
+
+    with deadline_scope(Deadline(2500, clock=clock)):
+        docs = retriever.invoke("wordless humor")
+
+    assert [doc.metadata["search_type"] for doc in docs] == ["SEMANTIC"]
+    # count, $search, then $vectorSearch after the 400 ms embedding call
+    assert retriever.collection.max_time_ms == [1000, 2000, 1700]
+
+
+def test_retriever_skips_semantic_and_fallbacks_when_deadline_is_short(retriever, clock):
+    from deadline import Deadline, deadline_scope
+
+    with deadline_scope(Deadline(1200, clock=clock)):
+        docs = retriever.invoke("wordless humor")
+
+    assert docs == []
+    assert retriever.embeddings.calls == []
+    assert len(retriever.collection.pipelines) == 1
+
+
+def test_run_chain_shrinks_generation_then_falls_back(lambda_env, clock):
+    from deadline import Deadline
+    from langchain_core.documents import Document
+    import langchain_mongodb
+
+    generated = []
+
+    class FakeCombineChain:
+        def invoke(self, inputs):
+            generated.append(langchain_mongodb.generation_max_length())
+            return {"output_text": "generated"}
+
+    class FakeRetriever:
+        def __init__(self, latency_ms):
+            self.latency_ms = latency_ms
+
+        def invoke(self, query):
+            clock.advance_ms(self.latency_ms)
+            return [Document(page_content="Outlaws hold up a train.", metadata={"title": "The Great Train Robbery"})]
+
+    chain = SimpleNamespace(retriever=FakeRetriever(latency_ms=1000), combine_documents_chain=FakeCombineChain())
+
+    result = langchain_mongodb.run_chain(chain, "train robbery", deadline=Deadline(30000, clock=clock))
+    assert result["answer"] == "generated"
+    assert generated == [langchain_mongodb.MAX_LENGTH]
+
+    result = langchain_mongodb.run_chain(chain, "train robbery", deadline=Deadline(6500, clock=clock))
+    assert result["answer"] == "generated"
+    assert generated[-1] == 100
+
+    chain.retriever.latency_ms = 2500
+    result = langchain_mongodb.run_chain(chain, "train robbery", deadline=Deadline(4000, clock=clock))
+    assert len(generated) == 2
+    assert result["answer"].startswith("Based on the retrieved documents about 'train robbery'")
+    assert len(result["source_documents"]) == 1
+
+
+def test_endpoint_calls_are_abandoned_at_their_deadline_capped_timeout(retriever, clock, monkeypatch):
+    import time
+    from deadline import Deadline, deadline_scope
+    from langchain_core.documents import Document
+    import langchain_mongodb
+    import mongodb_retriever
+    from resilience import get_breaker
+
+    class HangingEndpoint:
+        def invoke(self, inputs):
+            time.sleep(0.5)
+            return {"output_text": "generated"}
+
+        def embed_query(self, text):
+            time.sleep(0.5)
+            return [0.1] * 384
+
+    monkeypatch.setattr(mongodb_retriever, "EMBEDDING_READ_TIMEOUT_S", 0.05)
+    monkeypatch.setattr(langchain_mongodb, "LLM_READ_TIMEOUT_S", 0.05)
+    retriever.embeddings = HangingEndpoint()
+    retriever.collection.docs = []
+    chain = SimpleNamespace(
+        retriever=SimpleNamespace(invoke=lambda query: [Document(page_content="Outlaws hold up a train.")]),
+        combine_documents_chain=HangingEndpoint())
+
+    start = time.perf_counter()
+    with deadline_scope(Deadline(30000, clock=clock)):
+        assert retriever._semantic_search("wordless humor") == []
+    result = langchain_mongodb.run_chain(chain, "train robbery", deadline=Deadline(30000, clock=clock))
+
+    assert time.perf_counter() - start < 0.5
+    assert result["answer"].startswith("Based on the retrieved documents about 'train robbery'")
+    assert get_breaker("embedding").counters["failures"] == 1
+    assert get_breaker("llm").counters["failures"] == 1
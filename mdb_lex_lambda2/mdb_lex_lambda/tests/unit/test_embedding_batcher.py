@@ -0,0 +1,56 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from .fakes import FakeEmbeddings
+
+
+class RecordingEmbeddings(FakeEmbeddings):
+    def __init__(self, fail=False):
+        super().__init__()
+        self.batches = []
+        self.fail = fail
+
+    def embed_documents(self, texts):
+        self.batches.append(list(texts))
+        if self.fail:
+            raise TimeoutError("endpoint timed out")
+        return [[float(len(text))] for text in texts]
+
+
+def test_concurrent_queries_share_one_endpoint_call():
+    from embedding_batcher import EmbeddingBatcher
+
+    embeddings = RecordingEmbeddings()
+    batcher = EmbeddingBatcher(embeddings, window_ms=200, max_batch=4)
+    texts = ["a", "bb", "ccc", "dddd", "eeeee", "ffffff"]
+    barrier = threading.Barrier(len(texts))
+
+    def embed(text):
+        barrier.wait()
+        return batcher.embed_query(text)
+
+    with ThreadPoolExecutor(max_workers=len(texts)) as executor:
+        vectors = list(executor.map(embed, texts))
+    batcher.close()
+
+    assert vectors == [[float(len(text))] for text in texts]
+    assert sorted(len(batch) for batch in embeddings.batches) == [2, 4]
+    metrics = batcher.metrics()
+    assert metrics["queries"] == 6 and metrics["batches"] == 2
+    assert metrics["largest_batch"] == 4 and metrics["mean_batch"] == 3.0
+
+
+def test_endpoint_errors_reach_every_caller():
+    from embedding_batcher import EmbeddingBatcher
+
+    batcher = EmbeddingBatcher(RecordingEmbeddings(fail=True), window_ms=1)
+
+    with pytest.raises(TimeoutError):
+        batcher.embed_query("modern times")
+    assert batcher.metrics()["failures"] == 1
+
+    batcher.close()
+    with pytest.raises(RuntimeError):
+        batcher.embed_query("modern times")
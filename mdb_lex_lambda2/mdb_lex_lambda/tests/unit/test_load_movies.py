@@ -0,0 +1,63 @@
+import os
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+
+mongomock = pytest.importorskip("mongomock")
+
+MOVIES_JSON = os.path.join(os.path.dirname(__file__), "..", "..", "util", "movies.json")
+
+
+@pytest.fixture()
+def db():
+    return mongomock.MongoClient()["sample_mflix"]
+
+
+def test_read_batches_streams_extended_json():
+    from load_movies import read_batches
+
+    batches = list(read_batches(MOVIES_JSON, batch_size=64))
+
+    assert [len(batch) for batch in batches] == [64, 64, 64, 8]
+    first = batches[0][0]
+    assert first["_id"] == ObjectId("573a1390f29313caabcd42e8")
+    assert isinstance(first["released"], datetime)
+
+
+def test_load_inserts_in_parallel_and_counts_duplicates(db):
+    from load_movies import load
+
+    stats = load(db.movies, MOVIES_JSON, batch_size=37, workers=3, meta_collection=db.movies_meta)
+    print(f"\nLoad stats: {stats}")
+
+    assert stats["documents"] == stats["inserted"] == 200
+    assert stats["docs_per_sec"] > 0
+    assert db.movies.count_documents({}) == 200
+    assert db.movies_meta.find_one({"_id": "version"})["version"] == 1
+
+    # Unordered batches keep going past duplicate keys
+    stats = load(db.movies, MOVIES_JSON, batch_size=50, workers=2, meta_collection=db.movies_meta)
+    assert stats["inserted"] == 0
+    assert stats["duplicates"] == 200
+    assert stats["errors"] == 0
+    assert db.movies_meta.find_one({"_id": "version"})["version"] == 1
+
+
+def test_load_embeds_in_the_same_pass(db):
+    from load_movies import load
+
+    calls = []
+
+    def embed(texts):
+        calls.append(len(texts))
+        return [[float(len(text))] * 4 for text in texts]
+
+    stats = load(db.movies, MOVIES_JSON, batch_size=100, workers=2, embed=embed,
+                 field_name="fullplot", vectorized_field_name="egVector")
+
+    with_plot = db.movies.count_documents({"fullplot": {"$exists": True, "$ne": ""}})
+    assert stats["embedded"] == with_plot == sum(calls)
+    assert len(calls) == 2
+    doc = db.movies.find_one({"_id": ObjectId("573a1390f29313caabcd42e8")})
+    assert doc["egVector"] == [float(len(doc["fullplot"]))] * 4
@@ -0,0 +1,61 @@
+import pytest
+
+from .fakes import FakeCollection, FakeEmbeddings, make_retriever, movie
+
+
+def test_split_passages_overlaps_windows():
+    from passages import split_passages
+
+    words = [f"w{n}" for n in range(25)]
+    passages = split_passages(" ".join(words), max_words=10, overlap_words=3)
+
+    assert [p.split()[0] for p in passages] == ["w0", "w7", "w14", "w21"]
+    assert passages[1].split()[:3] == words[7:10]
+    assert passages[-1].split() == words[21:]
+    assert split_passages("one short plot", max_words=10, overlap_words=3) == ["one short plot"]
+    assert split_passages("   ") == []
+    with pytest.raises(ValueError):
+        split_passages("text", max_words=5, overlap_words=5)
+
+
+def test_group_by_parent_keeps_best_parents_and_reading_order():
+    from passages import group_by_parent
+
+    hits = [
+        {"_id": "a2", "parent_id": "a", "chunk_index": 2, "score": 0.9},
+        {"_id": "b0", "parent_id": "b", "chunk_index": 0, "score": 0.8},
+        {"_id": "a0", "parent_id": "a", "chunk_index": 0, "score": 0.7},
+        {"_id": "a1", "parent_id": "a", "chunk_index": 1, "score": 0.6},
+        {"_id": "c0", "parent_id": "c", "chunk_index": 0, "score": 0.5},
+    ]
+    groups = group_by_parent(hits, k=2, max_passages=2)
+
+    assert [group["parent_id"] for group in groups] == ["a", "b"]
+    assert [hit["_id"] for hit in groups[0]["passages"]] == ["a0", "a2"]
+    assert groups[0]["score"] == 0.9
+
+
+def test_retriever_returns_only_matching_passages(lambda_env, monkeypatch):
+    monkeypatch.setenv("MONGO_CHUNK_COLLECTION", "movies_chunks")
+    fullplot = "Opening scene. " * 50 + "The clown is slapped in the ring."
+    collection = FakeCollection(docs=[movie("He Who Gets Slapped", fullplot, year=1924)])
+    retriever = make_retriever(collection, FakeEmbeddings())
+    retriever.chunk_collection = FakeCollection(
+        docs=[{"_id": "p7", "parent_id": "he-who-gets-slapped", "chunk_index": 7,
+               "text": "The clown is slapped in the ring."}],
+        vector_hits=[{"_id": "p7", "parent_id": "he-who-gets-slapped", "chunk_index": 7,
+                      "text": "The clown is slapped in the ring.", "score": 0.91}],
+    )
+    assert retriever.search_mode == "passages"
+
+    for _ in range(2):
+        docs = retriever.invoke("wordless humor")
+        assert len(docs) == 1
+        assert docs[0].page_content == "The clown is slapped in the ring."
+        assert docs[0].metadata["title"] == "He Who Gets Slapped"
+        assert docs[0].metadata["passage_ids"] == ["p7"]
+        assert docs[0].metadata["score"] == 0.91
+
+    # the second call was hydrated from the retrieval cache
+    assert len(retriever.chunk_collection.pipelines) == 1
+    assert len(docs[0].page_content) < len(fullplot) / 10
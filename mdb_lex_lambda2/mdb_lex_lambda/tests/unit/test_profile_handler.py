@@ -0,0 +1,69 @@
+from types import SimpleNamespace
+
+import pytest
+
+
+def test_recommend_memory_mb():
+    from profile_handler import recommend_memory_mb
+
+    assert recommend_memory_mb(60) == 128
+    assert recommend_memory_mb(100) == 192
+    assert recommend_memory_mb(400) == 576
+
+
+def test_synthetic_events_are_lex_shaped():
+    from profile_handler import load_movies, synthetic_events
+
+    events = synthetic_events(load_movies(), 6)
+
+    assert len(events) == 6
+    assert all(event["inputTranscript"] for event in events)
+    assert all(event["sessionState"] == {"sessionAttributes": {}} for event in events)
+    assert events == synthetic_events(load_movies(), 6)
+
+
+def test_synthesise_catalogue_pads_movies_json_with_distinct_movies():
+    from profile_handler import load_movies, synthesise_catalogue
+
+    movies = load_movies()
+    catalogue = synthesise_catalogue(movies, 1000, seed=7)
+
+    assert len(catalogue) == 1000
+    assert catalogue[:len(movies)] == movies
+    assert len({movie["_id"] for movie in catalogue}) == 1000
+    assert len({movie["title"] for movie in catalogue}) > 900
+    assert synthesise_catalogue(movies, 10) == movies
+
+
+@pytest.fixture()
+def stubbed_env(lambda_env, monkeypatch):
+    import langchain_mongodb
+    import mongodb_retriever
+    import query_router
+    from profile_handler import STUB_ENVIRONMENT
+
+    for name, value in STUB_ENVIRONMENT.items():
+        monkeypatch.setenv(name, value)
+    # install_stubs replaces these module attributes; restore them afterwards
+    monkeypatch.setattr(mongodb_retriever, "MongoClient", mongodb_retriever.MongoClient)
+    monkeypatch.setattr(mongodb_retriever, "sagemaker_runtime_client", mongodb_retriever.sagemaker_runtime_client)
+    monkeypatch.setattr(langchain_mongodb, "sagemaker_runtime_client", langchain_mongodb.sagemaker_runtime_client)
+    monkeypatch.setattr(langchain_mongodb, "_chain", None)
+    # latency_worker times the router build by wrapping from_collection
+    monkeypatch.setattr(query_router.QueryRouter, "from_collection",
+                        query_router.QueryRouter.__dict__["from_collection"])
+
+
+def test_latency_worker_runs_handler_against_stubs(stubbed_env):
+    from profile_handler import latency_worker
+
+    args = SimpleNamespace(events=3, seed=7, catalogue_size=1000,
+                           mongo_latency_ms=0, embedding_latency_ms=0, llm_latency_ms=0)
+    result = latency_worker(args)
+    print(f"\nProfile: {result}")
+
+    assert result["warm_invocations"] == 3
+    assert result["catalogue_size"] == 1000
+    assert result["router_build_ms"] > 0
+    assert result["cold_invocation_ms"] > 0
+    assert result["peak_rss_mb"] >= result["peak_rss_after_cold_mb"] > 0
@@ -0,0 +1,120 @@
+import numpy as np
+import pytest
+from bson import ObjectId
+
+from .fakes import FakeCollection, FakeEmbeddings, MongomockBulkWrite, make_retriever, movie
+
+
+def clustered_vectors(n=400, dimensions=48, rank=8, seed=3):
+    """Unit vectors with most of their variance in a few directions, like sentence embeddings"""
+    rng = np.random.default_rng(seed)
+    signal = rng.normal(size=(n, rank)) @ rng.normal(size=(rank, dimensions))
+    vectors = signal + 0.2 * rng.normal(size=(n, dimensions))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+@pytest.mark.parametrize("method", ["pca", "truncate"])
+def test_lambda_projection_matches_pipeline(method):
+    from fit_projection import fit, project_matrix
+    from projection import Projection
+
+    matrix = clustered_vectors()
+    projection = Projection.from_document(fit(matrix, 12, method, version=3).to_document())
+
+    assert projection.version == 3 and projection.field == "egVectorReduced"
+    expected = project_matrix(matrix[:5], projection)
+    for row, reduced in zip(matrix[:5], expected):
+        assert np.allclose(projection.project(row.tolist()), reduced, atol=1e-5)
+
+
+def test_two_stage_recovers_recall_lost_by_reduction():
+    from fit_projection import evaluate, fit
+
+    matrix = clustered_vectors()
+    report = evaluate(matrix, fit(matrix, 8), k=10, queries=50)
+    print(f"\nProjection report: {report}")
+
+    assert report["explained_variance"] > 0.8
+    assert report["recall_two_stage"] >= report["recall_reduced_only"]
+    assert report["recall_two_stage"] >= 0.95
+    assert report["reduced_index_mb"] < report["full_index_mb"]
+
+
+def test_as_floats_reads_only_float32_bson_vectors():
+    from bson.binary import Binary, BinaryVectorDtype
+    from projection import as_floats
+    from vector_io import to_bson_vector
+
+    assert as_floats(to_bson_vector(np.array([0.5, -1.0], dtype=np.float32))) == [0.5, -1.0]
+    assert as_floats([1, 2]) == [1.0, 2.0]
+    with pytest.raises(ValueError):
+        as_floats(Binary.from_vector([1, 2, 3, 4], BinaryVectorDtype.INT8))
+    with pytest.raises(ValueError):
+        as_floats(Binary(b"\x27\x00" + np.zeros(2, dtype=np.float32).tobytes(), 0))
+
+
+def test_write_reduced_stamps_projection_version():
+    mongomock = pytest.importorskip("mongomock")
+    from fit_projection import fit, next_version, publish, write_reduced
+    from projection import get_projection
+
+    db = mongomock.MongoClient()["sample_mflix"]
+    collection = MongomockBulkWrite(db["movies"])
+    matrix = clustered_vectors(n=20)
+    ids = [ObjectId() for _ in range(20)]
+    collection.insert_many([{"_id": doc_id, "egVector": row.tolist()} for doc_id, row in zip(ids, matrix)])
+
+    projection = fit(matrix, 6, version=next_version(db["movies_meta"]))
+    assert write_reduced(collection, ids, matrix, projection, batch_size=7) == 20
+    publish(db["movies_meta"], projection)
+
+    stored = collection.find_one({"_id": ids[0]})
+    assert len(stored["egVectorReduced"]) == 6
+    assert stored["projectionVersion"] == 1
+    assert db["movies_meta"].find_one({"_id": "version"})["version"] == 1
+    assert next_version(db["movies_meta"]) == 2
+    assert get_projection(db["movies_meta"], 1).dimensions == 6
+
+
+@pytest.fixture()
+def two_stage(lambda_env):
+    from fit_projection import fit
+
+    matrix = clustered_vectors(n=20)
+    projection = fit(matrix, 6, version=4)
+    # The reduced first pass ranks these worst-first; rescoring on egVector fixes it
+    query = matrix[0]
+    order = np.argsort(matrix @ query)
+    hits = [movie(f"Movie {n}", f"plot {n}", egVector=matrix[n].tolist(), score=0.5) for n in order]
+    collection = FakeCollection(docs=hits, vector_hits=hits)
+    retriever = make_retriever(collection, FakeEmbeddings(vector=query.tolist()), k=2)
+    retriever.reduced_index_name = "reduced-index"
+    retriever.meta_collection = FakeCollection(docs=[{"_id": "version", "version": 1}, projection.to_document()])
+    return retriever, collection, query
+
+
+def test_vector_search_rescores_reduced_candidates(two_stage):
+    retriever, collection, query = two_stage
+
+    docs = retriever._vector_search(query.tolist(), version=1)
+
+    stage = collection.pipelines[-1][0]["$vectorSearch"]
+    assert stage["index"] == "reduced-index"
+    assert stage["path"] == "egVectorReduced"
+    assert stage["filter"] == {"projectionVersion": 4}
+    assert len(stage["queryVector"]) == 6
+    assert stage["limit"] == 20
+    assert docs[0].metadata["_id"] == "movie-0"
+    assert docs[0].metadata["score"] == pytest.approx(1.0)
+    assert docs[0].metadata["score"] >= docs[1].metadata["score"]
+
+
+def test_vector_search_uses_full_vectors_without_projection(two_stage):
+    retriever, collection, query = two_stage
+    retriever.meta_collection = FakeCollection(docs=[{"_id": "version", "version": 1}])
+
+    docs = retriever._vector_search(query.tolist(), version=1)
+
+    assert len(collection.pipelines) == 1
+    assert collection.pipelines[0][0]["$vectorSearch"]["index"] == "vector-index"
+    assert len(docs) == 2
@@ -0,0 +1,176 @@
+import os
+import time
+from types import SimpleNamespace
+
+import pytest
+from bson import json_util
+
+from .fakes import FakeCollection, FakeEmbeddings, make_retriever, movie
+
+MOVIES_JSON = os.path.join(os.path.dirname(__file__), "..", "..", "util", "movies.json")
+
+
+@pytest.fixture()
+def router():
+    from query_router import QueryRouter
+
+    with open(MOVIES_JSON) as f:
+        return QueryRouter.from_documents(json_util.loads(line) for line in f)
+
+
+def test_routing_accuracy_on_labelled_queries(router):
+    from query_router import evaluate
+    from test_hybrid_search import ROUTING_QUERIES
+
+    report = evaluate(router, ROUTING_QUERIES, keyword_rtt_ms=30, semantic_ms=60)
+    print(f"\nRouting report: {report}")
+
+    # two descriptions made of title words that are still rare in 200 films
+    assert report["queries"] == 40 and report["accuracy"] == 0.95
+    assert {query for query, *_ in report["mistakes"]} == {"a woman disguised as a man", "a king and his queen"}
+    assert report["keyword_round_trips_avoided"] == 14
+    assert report["keyword_latency_saved_ms"] == 420
+    assert report["semantic_searches_added"] == 8
+    assert report["semantic_latency_added_ms"] == 480
+    assert report["estimated_latency_saved_ms"] == -60
+
+
+def test_common_title_words_do_not_route_to_keyword_search():
+    from query_router import BOTH, KEYWORD, SEMANTIC, QueryRouter
+
+    # a large catalogue: "dog", "war" and "horses" are each in dozens of titles
+    titles = [f"{word} {n}" for word in ("the dog", "war", "horses of the west") for n in range(40)]
+    titles += ["the great train robbery", "gertie the dinosaur"]
+    router = QueryRouter(titles, names=["Buster Keaton", "Fred Astaire"])
+
+    assert router.route("dog")[0] == SEMANTIC
+    assert router.route("war horses")[0] == SEMANTIC
+    assert router.route("a dog in the war")[0] == SEMANTIC
+    assert router.route("dinosaur dog")[0] == BOTH
+    assert router.route("train robbery")[0] == KEYWORD
+    assert router.route("astaire war musicals")[0] == BOTH
+    assert router.route("keaton films")[0] == KEYWORD
+
+
+def test_semantic_route_skips_keyword_round_trip(lambda_env):
+    collection = FakeCollection(
+        docs=[movie("Modern Times", "A tramp struggles in the industrial world.", cast=["Charles Chaplin"])],
+        keyword_hits=[dict(movie("Modern Times"), score=3.2)],
+        vector_hits=[dict(movie("Modern Times"), score=0.82)],
+    )
+    retriever = make_retriever(collection, FakeEmbeddings())
+
+    docs = retriever.invoke("wordless humor")
+    assert [doc.metadata["search_type"] for doc in docs] == ["SEMANTIC"]
+    assert [list(p[0]) for p in collection.pipelines] == [["$vectorSearch"]]
+
+    docs = retriever.invoke("charles chaplin")
+    assert [doc.metadata["search_type"] for doc in docs] == ["KEYWORD"]
+    assert [list(p[0]) for p in collection.pipelines][1:] == [["$search"]]
+
+
+def test_both_route_fuses_keyword_and_semantic_rankings(lambda_env):
+    collection = FakeCollection(
+        docs=[movie("Laugh, Clown, Laugh"), movie("He Who Gets Slapped")],
+        keyword_hits=[dict(movie("Laugh, Clown, Laugh"), score=2.5)],
+        vector_hits=[dict(movie("He Who Gets Slapped"), score=0.9), dict(movie("Laugh, Clown, Laugh"), score=0.8)],
+    )
+    retriever = make_retriever(collection, FakeEmbeddings())
+
+    docs = retriever.invoke("clown performance")
+    assert [doc.metadata["title"] for doc in docs] == ["Laugh, Clown, Laugh", "He Who Gets Slapped"]
+    assert [doc.metadata["search_type"] for doc in docs] == ["KEYWORD", "SEMANTIC"]
+
+
+def test_semantic_route_falls_back_to_keyword_search_near_deadline(lambda_env):
+    from deadline import Deadline, deadline_scope
+
+    collection = FakeCollection(
+        docs=[movie("Modern Times", "A tramp struggles in the industrial world.")],
+        keyword_hits=[dict(movie("Modern Times"), score=3.2)],
+        vector_hits=[dict(movie("Modern Times"), score=0.82)],
+    )
+    embeddings = FakeEmbeddings()
+    retriever = make_retriever(collection, embeddings)
+
+    with deadline_scope(Deadline(1000)):
+        docs = retriever.invoke("wordless humor")
+
+    assert embeddings.calls == []
+    assert [list(p[0]) for p in collection.pipelines] == [["$search"]]
+    assert [doc.metadata["search_type"] for doc in docs] == ["KEYWORD"]
+
+
+def test_get_router_rebuilds_in_background_and_keeps_it_without_a_version(lambda_env):
+    import threading
+    import query_router
+
+    collection = FakeCollection(docs=[movie("Modern Times", cast=["Charles Chaplin"])])
+
+    first = query_router.get_router(collection, 1, max_time_ms=500)
+    assert collection.max_time_ms == [500]
+    assert query_router.get_router(collection, None) is first
+    assert query_router.get_router(collection, 1) is first
+    assert len(collection.finds) == 1
+
+    # a new version is served by the old router until the rebuild finishes
+    collection.docs.append(movie("The General", cast=["Buster Keaton"]))
+    assert query_router.get_router(collection, 2) is first
+    for thread in threading.enumerate():
+        if thread.name == "query-router-build":
+            thread.join()
+    rebuilt = query_router.get_router(collection, 2)
+    assert rebuilt is not first
+    assert "buster keaton" in rebuilt.phrases
+    assert len(collection.finds) == 2
+
+
+def test_failed_router_build_is_retried_in_the_background_after_a_pause(lambda_env, monkeypatch):
+    import threading
+    import query_router
+
+    class UnreadableCollection(FakeCollection):
+        def find(self, filter=None, projection=None, **kwargs):
+            self.finds.append(filter)
+            raise TimeoutError("operation exceeded time limit")
+
+    collection = UnreadableCollection()
+    assert [query_router.get_router(collection, 1, max_time_ms=500) for _ in range(3)] == [None] * 3
+    assert len(collection.finds) == 1
+
+    monkeypatch.setattr(query_router, "ROUTER_RETRY_S", 0)
+    assert query_router.get_router(collection, 1) is None
+    for thread in threading.enumerate():
+        if thread.name == "query-router-build":
+            thread.join()
+    assert len(collection.finds) == 2
+
+
+def test_dictionary_read_is_held_to_its_budget_while_decoding(lambda_env):
+    from query_router import QueryRouter
+
+    class SlowCursor:
+        """Each document arrives within maxTimeMS on the server, but decoding them all takes longer"""
+
+        def limit(self, n):
+            return self
+
+        def max_time_ms(self, ms):
+            return self
+
+        def __iter__(self):
+            for n in range(10):
+                time.sleep(0.03)
+                yield movie(f"Movie {n}")
+
+    collection = SimpleNamespace(find=lambda *args: SlowCursor())
+    with pytest.raises(TimeoutError):
+        QueryRouter.from_collection(collection, max_time_ms=50)
+
+
+def test_get_router_does_not_wait_for_a_build_in_progress(lambda_env, monkeypatch):
+    import query_router
+
+    monkeypatch.setattr(query_router, "_router_building", True)
+
+    assert query_router.get_router(FakeCollection(docs=[movie("Modern Times")]), 1) is None
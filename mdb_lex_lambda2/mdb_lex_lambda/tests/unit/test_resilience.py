@@ -0,0 +1,178 @@
+from types import SimpleNamespace
+import threading
+import time
+
+import pytest
+
+from .fakes import FakeClock, FakeCollection, FakeEmbeddings, make_retriever, movie
+
+
+def test_breaker_opens_then_probes_half_open():
+    from resilience import CircuitBreaker, CircuitOpenError
+
+    clock = FakeClock()
+    breaker = CircuitBreaker("llm", failure_threshold=2, reset_timeout_s=30, clock=clock)
+
+    def fail():
+        raise ValueError("throttled")
+
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            breaker.call(fail)
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.call(lambda: "ok")
+
+    # After the cool-down a single probe goes through; a failed probe re-opens
+    clock.advance_ms(30000)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    clock.advance_ms(30000)
+    assert breaker.call(lambda: "ok") == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    metrics = breaker.metrics()
+    assert metrics["opened"] == 2
+    assert metrics["short_circuits"] == 2
+    assert metrics["successes"] == 1
+
+
+def test_hedged_call_sends_second_request_when_slow(monkeypatch):
+    import resilience
+
+    monkeypatch.setattr(resilience, "HEDGE_MIN_SAMPLES", 3)
+    breaker = resilience.CircuitBreaker("embedding")
+    for latency_ms in (5, 5, 5):
+        breaker.latencies.record(latency_ms)
+
+    release_first = threading.Event()
+    calls = []
+
+    def embed(text):
+        calls.append(text)
+        if len(calls) == 1:
+            release_first.wait(2)
+            return "slow"
+        return "hedged"
+
+    start = time.perf_counter()
+    assert resilience.hedged_call(embed, "query", breaker=breaker, percentile=95) == "hedged"
+    release_first.set()
+    assert time.perf_counter() - start < 1
+    assert calls == ["query", "query"]
+    assert breaker.metrics()["hedges"] == 1
+
+
+
+def test_queued_calls_time_out_without_tripping_the_breaker(lambda_env, monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+    from resilience import CircuitBreaker, QueueTimeoutError, call_with_timeout
+
+    monkeypatch.setenv("TIMEOUT_WORKERS", "2")
+    release = threading.Event()
+    llm, embedding = CircuitBreaker("llm"), CircuitBreaker("embedding", failure_threshold=1)
+
+    with ThreadPoolExecutor(max_workers=4) as requests:
+        # slow generations hold every worker of the llm pool
+        slow = [requests.submit(llm.call, call_with_timeout, release.wait, 2, pool="llm", timeout_ms=2000)
+                for _ in range(2)]
+        time.sleep(0.05)
+        with pytest.raises(QueueTimeoutError):
+            llm.call(call_with_timeout, lambda: "generated", pool="llm", timeout_ms=100)
+        # the embedding pool is separate, so embeddings are not queued behind generations
+        assert embedding.call(call_with_timeout, lambda: [0.1], pool="embedding", timeout_ms=100) == [0.1]
+        release.set()
+        assert all(future.result() for future in slow)
+
+    assert llm.counters["failures"] == 0 and llm.state == CircuitBreaker.CLOSED
+    assert embedding.counters["failures"] == 0
+
+def test_open_embedding_breaker_skips_semantic_search(lambda_env):
+    from resilience import get_breaker
+
+    embeddings = FakeEmbeddings()
+    retriever = make_retriever(FakeCollection(docs=[movie("Robin Hood", "An outlaw robs the rich.")]), embeddings)
+
+    breaker = get_breaker("embedding")
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+
+    docs = retriever.invoke("outlaw")
+    assert embeddings.calls == []
+    assert [doc.metadata["search_type"] for doc in docs] == ["SIMPLE"]
+
+
+def test_open_embedding_breaker_uses_keyword_search_for_semantic_routes(lambda_env):
+    from resilience import get_breaker
+
+    embeddings = FakeEmbeddings()
+    collection = FakeCollection(
+        docs=[movie("Modern Times", "A tramp struggles in the industrial world.")],
+        keyword_hits=[dict(movie("Modern Times"), score=3.2)],
+    )
+    retriever = make_retriever(collection, embeddings)
+
+    breaker = get_breaker("embedding")
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+
+    # routed SEMANTIC, but the endpoint is unhealthy: keyword search, not the regex scan
+    docs = retriever.invoke("wordless humor")
+    assert embeddings.calls == []
+    assert [list(p[0]) for p in collection.pipelines] == [["$search"]]
+    assert [doc.metadata["search_type"] for doc in docs] == ["KEYWORD"]
+
+
+
+def test_half_open_breaker_with_probe_in_flight_uses_keyword_search(lambda_env):
+    from resilience import get_breaker
+
+    embeddings = FakeEmbeddings()
+    collection = FakeCollection(
+        docs=[movie("Modern Times", "A tramp struggles in the industrial world.")],
+        keyword_hits=[dict(movie("Modern Times"), score=3.2)],
+    )
+    retriever = make_retriever(collection, embeddings)
+
+    clock = FakeClock()
+    breaker = get_breaker("embedding")
+    breaker.clock = clock
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    clock.advance_ms(breaker.reset_timeout_s * 1000)
+    # another request is probing the endpoint
+    assert breaker.allow_request()
+
+    docs = retriever.invoke("wordless humor")
+    assert embeddings.calls == []
+    assert [doc.metadata["search_type"] for doc in docs] == ["KEYWORD"]
+
+def test_open_llm_breaker_answers_with_fallback_llm(lambda_env):
+    from langchain_core.documents import Document
+    import langchain_mongodb
+    from resilience import get_breaker
+
+    class FailingCombineChain:
+        calls = 0
+
+        def invoke(self, inputs):
+            FailingCombineChain.calls += 1
+            raise ValueError("Error raised by inference endpoint: ThrottlingException")
+
+    docs = [Document(page_content="An outlaw robs the rich.", metadata={"title": "Robin Hood"})]
+    chain = SimpleNamespace(retriever=SimpleNamespace(invoke=lambda query: docs),
+                            combine_documents_chain=FailingCombineChain())
+
+    breaker = get_breaker("llm")
+    for _ in range(breaker.failure_threshold):
+        result = langchain_mongodb.run_chain(chain, "outlaw")
+        assert result["answer"].startswith("Based on your query 'outlaw'")
+
+    result = langchain_mongodb.run_chain(chain, "outlaw")
+    assert FailingCombineChain.calls == breaker.failure_threshold
+    assert result["answer"].startswith("Based on the retrieved documents about 'outlaw'")
+    assert breaker.metrics()["state"] == "open"
@@ -0,0 +1,54 @@
+from .fakes import FakeClock, FakeCollection, FakeEmbeddings, make_retriever, movie
+
+
+def test_cache_is_bounded_and_versioned():
+    from retrieval_cache import RetrievalCache
+
+    cache = RetrievalCache(max_entries=2)
+    for query in ("robin hood", "buster keaton", "train robbery"):
+        cache.put(cache.key(query, 3, "hybrid"), 1, [(query, 1.0, "KEYWORD", ())])
+
+    assert cache.get(cache.key("Robin Hood!", 3, "hybrid"), 1) is None
+    assert cache.get(cache.key("  Train   Robbery ", 3, "hybrid"), 1) == [("train robbery", 1.0, "KEYWORD", ())]
+    assert cache.get(cache.key("train robbery", 3, "hybrid"), 2) is None
+    assert cache.get(cache.key("train robbery", 3, "hybrid"), 1) is None
+
+    assert cache.metrics() == {"hits": 1, "misses": 3, "stale": 1, "evictions": 1,
+                               "size": 1, "hit_rate": 0.25}
+
+
+def test_repeated_query_is_served_from_cache_until_version_changes(lambda_env, monkeypatch):
+    import retrieval_cache
+    from retrieval_cache import get_retrieval_cache
+
+    clock = FakeClock()
+    monkeypatch.setattr(retrieval_cache, "_clock", clock)
+
+    collection = FakeCollection(
+        docs=[movie("Modern Times", "A tramp struggles in the industrial world."),
+              movie("The General", "An engineer chases his stolen locomotive.")],
+        vector_hits=[dict(movie("Modern Times"), score=0.82), dict(movie("The General"), score=0.71)],
+    )
+    embeddings = FakeEmbeddings()
+    retriever = make_retriever(collection, embeddings)
+
+    first = retriever.invoke("wordless humor")
+    second = retriever.invoke("Wordless humor?")
+
+    assert [doc.metadata["title"] for doc in second] == ["Modern Times", "The General"]
+    assert [doc.metadata["score"] for doc in second] == [0.82, 0.71]
+    assert second[0].page_content == "A tramp struggles in the industrial world."
+    assert [doc.metadata for doc in first] == [doc.metadata for doc in second]
+    assert len(collection.pipelines) == 1
+    assert len(embeddings.calls) == 1
+    # the version token was read once for both requests
+    assert len(retriever.meta_collection.finds) == 1
+
+    # Re-indexing bumps the version; once the token expires the cached ranking is not reused
+    retriever.meta_collection.update_one({"_id": "version"}, {"$inc": {"version": 1}})
+    retriever.invoke("wordless humor")
+    assert len(collection.pipelines) == 1
+    clock.advance_ms(retrieval_cache.VERSION_TTL_S * 1000)
+    retriever.invoke("wordless humor")
+    assert len(collection.pipelines) == 2
+    assert get_retrieval_cache().metrics()["stale"] == 1
@@ -0,0 +1,156 @@
+import asyncio
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from .fakes import FakeCollection, FakeEmbeddings, make_retriever, movie
+
+
+@pytest.fixture()
+def server(lambda_env, monkeypatch):
+    import langchain_mongodb
+    import server
+
+    docs = [movie("Modern Times", "A tramp struggles in the industrial world.", year=1936),
+            movie("The General", "An engineer chases his stolen locomotive.", year=1926)]
+    collection = FakeCollection(docs=docs, vector_hits=[dict(doc, score=0.8) for doc in docs])
+    embeddings = FakeEmbeddings()
+    retriever = make_retriever(collection, embeddings)
+
+    class EchoCombineChain:
+        def invoke(self, inputs):
+            return {"output_text": inputs["input_documents"][0].page_content}
+
+    monkeypatch.setattr(langchain_mongodb, "_chain",
+                        SimpleNamespace(retriever=retriever, combine_documents_chain=EchoCombineChain()))
+    monkeypatch.setattr(server, "_batcher", None)
+    monkeypatch.setattr(server, "_started", False)
+    server.start()
+    yield SimpleNamespace(server=server, retriever=retriever, embeddings=embeddings)
+    server.stop()
+
+
+def test_concurrent_first_requests_build_one_chain(lambda_env, monkeypatch):
+    import threading
+    import time
+    import langchain_mongodb
+    import server
+
+    builds = []
+
+    docs = [movie("Modern Times", "A tramp struggles in the industrial world.", year=1936)]
+
+    class EchoCombineChain:
+        def invoke(self, inputs):
+            return {"output_text": inputs["input_documents"][0].page_content}
+
+    def build_chain():
+        builds.append(threading.current_thread().name)
+        time.sleep(0.05)
+        collection = FakeCollection(docs=docs, vector_hits=[dict(doc, score=0.8) for doc in docs])
+        return SimpleNamespace(retriever=make_retriever(collection, FakeEmbeddings()),
+                               combine_documents_chain=EchoCombineChain())
+
+    monkeypatch.setattr(langchain_mongodb, "_chain", None)
+    monkeypatch.setattr(langchain_mongodb, "build_chain", build_chain)
+    monkeypatch.setattr(server, "_batcher", None)
+    monkeypatch.setattr(server, "_started", False)
+    monkeypatch.setenv("SERVER_WORKERS", "24")
+
+    async def first_requests():
+        # no lifespan startup: the first requests start the server themselves
+        body = json.dumps(lex_event("wordless humor")).encode()
+        return await asyncio.gather(*[server.handle("POST", "/lex", body) for _ in range(4)])
+
+    responses = asyncio.run(first_requests())
+    try:
+        assert [status for status, _ in responses] == [200] * 4
+        assert len(builds) == 1
+        assert langchain_mongodb._chain.retriever.embeddings is server._batcher
+        assert os.environ["SAGEMAKER_MAX_POOL_CONNECTIONS"] == os.environ["TIMEOUT_WORKERS"] == "24"
+    finally:
+        server.stop()
+
+
+def lex_event(text):
+    return {"inputTranscript": text, "sessionState": {"sessionAttributes": {}}}
+
+
+def test_start_puts_batcher_in_front_of_embeddings(server):
+    assert server.retriever.embeddings is server.server._batcher
+    assert server.server._batcher.embeddings is server.embeddings
+
+
+def test_handle_answers_lex_events(server):
+    status, response = asyncio.run(server.server.handle(
+        "POST", "/lex", json.dumps(lex_event("wordless humor")).encode()))
+
+    assert status == 200
+    assert response["messages"][0]["content"] == "A tramp struggles in the industrial world."
+    assert json.loads(response["sessionState"]["sessionAttributes"]["mdbRetrievedIds"]) == \
+        ["modern-times", "the-general"]
+    assert server.embeddings.calls == ["wordless humor"]
+
+    status, health = asyncio.run(server.server.handle("GET", "/health", b""))
+    assert status == 200
+    assert health["embedding_batches"]["queries"] == 1
+
+
+@pytest.mark.parametrize("method, path, body, status", [
+    ("POST", "/lex", b"not json", 400),
+    ("POST", "/lex", b'{"sessionState": {}}', 400),
+    ("GET", "/lex", b"", 405),
+    ("GET", "/missing", b"", 404),
+])
+def test_handle_rejects_bad_requests(server, method, path, body, status):
+    assert asyncio.run(server.server.handle(method, path, body))[0] == status
+
+
+def test_http_server_keeps_connections_alive(server):
+    async def run():
+        srv = await asyncio.start_server(server.server._connection, "127.0.0.1", 0)
+        port = srv.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        responses = []
+        for text in ("wordless humor", "locomotive chase"):
+            body = json.dumps(lex_event(text)).encode()
+            writer.write(f"POST /lex HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\n\r\n".encode()
+                         + body)
+            await writer.drain()
+            status_line = await reader.readline()
+            headers = {}
+            while (line := await reader.readline()) != b"\r\n":
+                name, _, value = line.decode().partition(":")
+                headers[name.strip().lower()] = value.strip()
+            payload = json.loads(await reader.readexactly(int(headers["content-length"])))
+            responses.append((status_line.split()[1], headers["connection"], payload))
+        writer.close()
+        srv.close()
+        await srv.wait_closed()
+        return responses
+
+    responses = asyncio.run(run())
+
+    assert [(status, connection) for status, connection, _ in responses] == \
+        [(b"200", "keep-alive"), (b"200", "keep-alive")]
+    assert all(payload["messages"][0]["content"] for _, _, payload in responses)
+
+
+def test_asgi_application_serves_lex_events(server):
+    sent = []
+    body = json.dumps(lex_event("wordless humor")).encode()
+    messages = [{"type": "http.request", "body": body[:10], "more_body": True},
+                {"type": "http.request", "body": body[10:], "more_body": False}]
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(server.server.application({"type": "http", "method": "POST", "path": "/lex"}, receive, send))
+
+    assert sent[0]["status"] == 200
+    assert json.loads(sent[1]["body"])["messages"][0]["content"]
@@ -0,0 +1,145 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from .fakes import FakeCollection, FakeEmbeddings, make_retriever, movie
+
+
+def test_session_attributes_round_trip():
+    from session_context import SessionContext
+
+    session = SessionContext(["modern-times"], [0.25, -1.5, 3.0], {"turns": 2}, {"modern-times": ["p3"]})
+    attributes = session.to_lex({"userName": "sam"})
+
+    assert attributes["userName"] == "sam"
+    assert all(isinstance(value, str) for value in attributes.values())
+    restored = SessionContext.from_lex(attributes)
+    assert restored.ids == ["modern-times"]
+    assert restored.query_vector == [0.25, -1.5, 3.0]
+    assert restored.stats["turns"] == 2
+    assert restored.passages == {"modern-times": ["p3"]}
+
+    assert SessionContext.from_lex({"mdbRetrievedIds": "not json"}).ids == []
+
+
+@pytest.mark.parametrize("query, kind", [
+    ("who starred in it?", "rerank"),
+    ("when was that released", "rerank"),
+    ("any more like that?", "similar"),
+    ("movies about a clown", None),
+    ("is it a silent comedy about a tramp in a factory", None),
+])
+def test_follow_up_kind(query, kind):
+    from session_context import SessionContext
+
+    assert SessionContext(["modern-times"], [0.1]).follow_up_kind(query) == kind
+    assert SessionContext().follow_up_kind(query) is None
+
+
+@pytest.fixture()
+def handler(lambda_env, monkeypatch):
+    import app
+    import langchain_mongodb
+
+    docs = [movie("Modern Times", "A tramp struggles in the industrial world.", cast=["Charles Chaplin"], year=1936),
+            movie("The General", "An engineer chases his stolen locomotive.", cast=["Buster Keaton"], year=1926),
+            movie("Sherlock Jr.", "A projectionist dreams himself into a film.", cast=["Buster Keaton"], year=1924)]
+    collection = FakeCollection(
+        docs=docs,
+        vector_hits=[dict(doc, score=score) for doc, score in zip(docs, (0.82, 0.71, 0.65))],
+    )
+    embeddings = FakeEmbeddings()
+    retriever = make_retriever(collection, embeddings)
+
+    class EchoCombineChain:
+        def invoke(self, inputs):
+            return {"output_text": inputs["input_documents"][0].page_content}
+
+    monkeypatch.setattr(langchain_mongodb, "_chain",
+                        SimpleNamespace(retriever=retriever, combine_documents_chain=EchoCombineChain()))
+    return SimpleNamespace(app=app, collection=collection, embeddings=embeddings)
+
+
+def test_follow_up_turns_reuse_previous_retrieval(handler):
+    def turn(text, attributes):
+        event = {"inputTranscript": text, "sessionState": {"sessionAttributes": attributes}}
+        return handler.app.lambda_handler(event, None)
+
+    response = turn("wordless humor", {})
+    attributes = response["sessionState"]["sessionAttributes"]
+    assert json.loads(attributes["mdbRetrievedIds"]) == ["modern-times", "the-general"]
+    assert len(handler.collection.pipelines) == 1
+    assert len(handler.embeddings.calls) == 1
+
+    response = turn("who starred in it?", attributes)
+    attributes = response["sessionState"]["sessionAttributes"]
+    assert "Cast: Charles Chaplin" in response["messages"][0]["content"]
+    assert len(handler.collection.pipelines) == 1
+    assert len(handler.embeddings.calls) == 1
+
+    response = turn("any more like that?", attributes)
+    attributes = response["sessionState"]["sessionAttributes"]
+    assert response["messages"][0]["content"] == "A projectionist dreams himself into a film."
+    assert len(handler.collection.pipelines) == 2
+    assert len(handler.embeddings.calls) == 1
+
+    assert json.loads(attributes["mdbRetrievalStats"]) == {
+        "turns": 3, "retrievals": 2, "retrievals_avoided": 1, "embeddings_avoided": 1}
+
+
+def test_similar_follow_up_after_a_cache_hit_reuses_the_cached_vector(handler):
+    def turn(text, attributes):
+        event = {"inputTranscript": text, "sessionState": {"sessionAttributes": attributes}}
+        return handler.app.lambda_handler(event, None)
+
+    turn("wordless humor", {})
+    # a second session asking the same question is answered from the retrieval cache
+    attributes = turn("wordless humor", {})["sessionState"]["sessionAttributes"]
+    assert len(handler.embeddings.calls) == 1
+    assert attributes["mdbQueryVector"]
+
+    response = turn("any more like that?", attributes)
+    assert response["messages"][0]["content"] == "A projectionist dreams himself into a film."
+    assert len(handler.embeddings.calls) == 1
+
+
+def test_similar_follow_up_to_a_keyword_turn_uses_its_results_vectors(lambda_env):
+    from session_context import SessionContext, session_scope
+
+    docs = [movie("Modern Times", egVector=[1.0, 0.0]), movie("The General", egVector=[0.0, 1.0]),
+            movie("Sherlock Jr.", egVector=[0.6, 0.8])]
+    collection = FakeCollection(docs=docs, vector_hits=[dict(doc, score=0.9) for doc in docs])
+    embeddings = FakeEmbeddings()
+    retriever = make_retriever(collection, embeddings)
+
+    with session_scope(SessionContext(["modern-times", "the-general"])) as session:
+        results = retriever.invoke("any more like them?")
+
+    assert [doc.metadata["_id"] for doc in results] == ["sherlock-jr."]
+    assert collection.pipelines[0][0]["$vectorSearch"]["queryVector"] == pytest.approx([0.7071, 0.7071], abs=1e-4)
+    assert embeddings.calls == []
+    assert session.stats["embeddings_avoided"] == 1
+
+
+def test_rerank_follow_up_in_passage_mode_reuses_the_previous_passages(lambda_env, monkeypatch):
+    from session_context import SessionContext, session_scope
+
+    monkeypatch.setenv("MONGO_CHUNK_COLLECTION", "movies_chunks")
+    fullplot = "Opening scene. " * 50 + "The clown is slapped in the ring."
+    collection = FakeCollection(docs=[movie("He Who Gets Slapped", fullplot, cast=["Lon Chaney"], year=1924)])
+    retriever = make_retriever(collection, FakeEmbeddings())
+    passage = {"_id": "p7", "parent_id": "he-who-gets-slapped", "chunk_index": 7,
+               "text": "The clown is slapped in the ring."}
+    retriever.chunk_collection = FakeCollection(docs=[passage], vector_hits=[dict(passage, score=0.91)])
+
+    with session_scope(SessionContext()) as session:
+        retriever.invoke("wordless humor")
+        assert session.passages == {"he-who-gets-slapped": ["p7"]}
+        docs = retriever.invoke("who starred in it?")
+
+    assert docs[0].page_content == "The clown is slapped in the ring.\nCast: Lon Chaney\nYear: 1924"
+    assert docs[0].metadata["search_type"] == "SESSION"
+    assert docs[0].metadata["passage_ids"] == ["p7"]
+    assert len(retriever.chunk_collection.pipelines) == 1
+    assert session.stats["retrievals_avoided"] == 1
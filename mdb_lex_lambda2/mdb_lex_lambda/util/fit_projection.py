@@ -0,0 +1,213 @@
+"""
+Fit a dimensionality-reducing projection for the embedding vectors and store
+a reduced vector next to each full one.
+
+  pca       PCA fitted with an SVD of the (centred) vectors
+  truncate  keep the first --dimensions values; only sensible for
+            Matryoshka-style embeddings, MiniLM is not trained that way
+
+The projection is published as the "projection" document of the meta
+collection with an incremented version, and every reduced vector is stamped
+with that version (projectionVersion), so the Lambda only compares a query
+projected with version n against vectors written with version n. Vectors are
+written first and the projection document after, then the collection version
+is bumped so running containers reload it.
+
+Before writing, recall@k and brute-force latency of the reduced first pass
+with full-vector rescoring are reported against an exact full-vector search,
+using document vectors as queries:
+
+    python fit_projection.py --dimensions 64 --report-only
+    python fit_projection.py --dimensions 64 --vectors vectors.npy --binary
+"""
+
+import warnings
+warnings.filterwarnings('ignore', category=RuntimeWarning)
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from pymongo import UpdateOne
+
+from vector_io import BATCH_SIZE, iter_vector_batches, read_vectors, to_bson_vector
+
+# the projection format and first-pass settings are shared with the Lambda retriever
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'hello_world'))
+from projection import PCA, PROJECTION_DOC_ID, PROJECTION_VERSION_FIELD, RESCORE_FACTOR, TRUNCATE, Projection
+from retrieval_cache import bump_collection_version
+
+
+def fit(matrix, dimensions, method=PCA, version=1, source_field="egVector", field=None):
+    """Projection of `matrix` rows down to `dimensions` values"""
+    if dimensions >= matrix.shape[1]:
+        raise ValueError(f"dimensions must be below the {matrix.shape[1]} of the full vectors")
+    field = field or f"{source_field}Reduced"
+    if method == TRUNCATE:
+        kept = np.square(matrix[:, :dimensions]).sum() / np.square(matrix).sum()
+        return Projection(version, TRUNCATE, dimensions, source_field, field,
+                          explained_variance=round(float(kept), 4))
+    mean = matrix.mean(axis=0)
+    # rows of vt are the principal axes, ordered by singular value
+    _, singular_values, vt = np.linalg.svd(matrix - mean, full_matrices=False)
+    variance = np.square(singular_values)
+    return Projection(version, PCA, dimensions, source_field, field,
+                      mean=mean.astype(np.float32).tolist(),
+                      components=vt[:dimensions].astype(np.float32).tolist(),
+                      explained_variance=round(float(variance[:dimensions].sum() / variance.sum()), 4))
+
+
+def unit_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def project_matrix(matrix, projection):
+    """Vectorised Projection.project for a batch of full vectors"""
+    if projection.method == TRUNCATE:
+        reduced = matrix[:, :projection.dimensions]
+    else:
+        reduced = (matrix - np.asarray(projection.mean, dtype=np.float32)) @ \
+            np.asarray(projection.components, dtype=np.float32).T
+    return unit_rows(reduced).astype(np.float32)
+
+
+def evaluate(matrix, projection, k=10, rescore_factor=RESCORE_FACTOR, queries=200, seed=0):
+    """Recall@k and per-query latency of reduced-only and two-stage search against exact search"""
+    full = unit_rows(matrix.astype(np.float32))
+    reduced = project_matrix(matrix, projection)
+    rng = np.random.default_rng(seed)
+    sample = rng.choice(len(full), size=min(queries, len(full)), replace=False)
+    candidates = min(k * rescore_factor, len(full) - 1)
+
+    def top(scores, n, exclude):
+        scores[exclude] = -np.inf
+        best = np.argpartition(-scores, n)[:n]
+        return best[np.argsort(-scores[best])]
+
+    timings = {"exact": 0.0, "two_stage": 0.0}
+    recall = {"reduced_only": 0.0, "two_stage": 0.0}
+    for i in sample:
+        start = time.perf_counter()
+        exact = set(top(full @ full[i], k, i))
+        timings["exact"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        first_pass = top(reduced @ reduced[i], candidates, i)
+        rescored = first_pass[np.argsort(-(full[first_pass] @ full[i]))[:k]]
+        timings["two_stage"] += time.perf_counter() - start
+
+        recall["reduced_only"] += len(exact & set(first_pass[:k])) / k
+        recall["two_stage"] += len(exact & set(rescored)) / k
+
+    return {
+        "method": projection.method,
+        "dimensions": projection.dimensions,
+        "full_dimensions": matrix.shape[1],
+        "explained_variance": projection.explained_variance,
+        "vectors": len(full),
+        "queries": len(sample),
+        "k": k,
+        "candidates": candidates,
+        "recall_reduced_only": round(recall["reduced_only"] / len(sample), 4),
+        "recall_two_stage": round(recall["two_stage"] / len(sample), 4),
+        "exact_ms_per_query": round(timings["exact"] * 1000 / len(sample), 3),
+        "two_stage_ms_per_query": round(timings["two_stage"] * 1000 / len(sample), 3),
+        "full_index_mb": round(full.nbytes / 2 ** 20, 2),
+        "reduced_index_mb": round(reduced.nbytes / 2 ** 20, 2),
+    }
+
+
+def write_reduced(collection, ids, matrix, projection, binary=False, batch_size=BATCH_SIZE):
+    """Store the reduced vectors, stamped with the projection version, next to the full ones"""
+    matched = 0
+    for start in range(0, len(ids), batch_size):
+        rows = project_matrix(matrix[start:start + batch_size], projection)
+        requests = [
+            UpdateOne({"_id": doc_id}, {"$set": {
+                projection.field: to_bson_vector(row) if binary else row.tolist(),
+                PROJECTION_VERSION_FIELD: projection.version,
+            }})
+            for doc_id, row in zip(ids[start:start + batch_size], rows)
+        ]
+        if requests:
+            matched += collection.bulk_write(requests, ordered=False).matched_count
+    return matched
+
+
+def publish(meta_collection, projection):
+    """Make `projection` current and invalidate cached retrieval results"""
+    meta_collection.replace_one({"_id": PROJECTION_DOC_ID}, projection.to_document(), upsert=True)
+    bump_collection_version(meta_collection)
+
+
+def next_version(meta_collection):
+    current = meta_collection.find_one({"_id": PROJECTION_DOC_ID})
+    return current["version"] + 1 if current else 1
+
+
+def load_matrix(batches):
+    ids, rows = [], []
+    for batch_ids, batch_rows in batches:
+        ids.extend(batch_ids)
+        rows.append(np.asarray(batch_rows, dtype=np.float32))
+    return ids, np.concatenate(rows) if rows else np.empty((0, 0), dtype=np.float32)
+
+
+def print_report(report):
+    print(f"{report['method']} {report['full_dimensions']} -> {report['dimensions']} dimensions "
+          f"(explained variance {report['explained_variance']}), {report['vectors']} vectors, "
+          f"{report['queries']} queries")
+    print(f"  recall@{report['k']}: reduced only {report['recall_reduced_only']}, "
+          f"reduced + rescore of {report['candidates']} candidates {report['recall_two_stage']}")
+    print(f"  brute-force latency: exact {report['exact_ms_per_query']}ms, "
+          f"two-stage {report['two_stage_ms_per_query']}ms per query")
+    print(f"  vector memory: full {report['full_index_mb']}MB, reduced {report['reduced_index_mb']}MB")
+
+
+def main():
+    import pymongo
+    from dotenv import load_dotenv
+
+    # Load environment variables from .env file
+    load_dotenv(os.path.join(os.path.dirname(__file__), '..', '.env'))
+
+    parser = argparse.ArgumentParser(description="Fit a projection and store reduced vectors")
+    parser.add_argument("--dimensions", type=int, default=64)
+    parser.add_argument("--method", choices=[PCA, TRUNCATE], default=PCA)
+    parser.add_argument("--vectors", help="read full vectors from a vector_io export instead of MongoDB")
+    parser.add_argument("--field", default=os.getenv("VECTORIZED_FIELD_NAME"))
+    parser.add_argument("--k", type=int, default=10, help="recall@k for the report")
+    parser.add_argument("--binary", action="store_true", help="store reduced vectors as BSON float32 vectors")
+    parser.add_argument("--report-only", action="store_true", help="compare methods without writing")
+    args = parser.parse_args()
+
+    mongo_collection = os.getenv("MONGO_COLLECTION")
+    db = pymongo.MongoClient(os.getenv("ATLAS_URI"))[os.getenv("MONGO_DB")]
+    collection = db[mongo_collection]
+    meta_collection = db[os.getenv("MONGO_META_COLLECTION", f"{mongo_collection}_meta")]
+
+    batches = read_vectors(args.vectors, args.field) if args.vectors else iter_vector_batches(collection, args.field)
+    ids, matrix = load_matrix(batches)
+    print(f"loaded {len(ids)} vectors of {matrix.shape[1] if len(ids) else 0} dimensions")
+
+    methods = [PCA, TRUNCATE] if args.report_only else [args.method]
+    for method in methods:
+        report = evaluate(matrix, fit(matrix, args.dimensions, method, source_field=args.field), k=args.k)
+        print_report(report)
+    if args.report_only:
+        return
+
+    projection = fit(matrix, args.dimensions, args.method, version=next_version(meta_collection),
+                     source_field=args.field)
+    start = time.perf_counter()
+    matched = write_reduced(collection, ids, matrix, projection, binary=args.binary)
+    publish(meta_collection, projection)
+    print(f"wrote {matched} reduced vectors to {projection.field} with projection "
+          f"v{projection.version} in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Streaming bulk loader for Extended JSON lines files such as movies.json.
+
+The file is read line by line and decoded with bson.json_util, so $oid/$date
+values arrive as ObjectId/datetime. Batches are written with unordered
+insert_many calls from a pool of worker threads, with at most two batches per
+worker in flight so memory stays bounded however large the file is.
+Optionally each batch is embedded with the SageMaker endpoint in the same pass.
+"""
+
+import warnings
+warnings.filterwarnings('ignore', category=RuntimeWarning)
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from bson import json_util
+from pymongo.errors import BulkWriteError
+
+# the version token is shared with the Lambda retriever
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'hello_world'))
+from retrieval_cache import bump_collection_version
+
+DUPLICATE_KEY = 11000
+EMBED_BATCH_SIZE = 32
+
+
+def read_batches(path, batch_size):
+    """Yield lists of up to `batch_size` decoded documents without reading the whole file"""
+    batch = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            batch.append(json_util.loads(line))
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def sagemaker_embedder(endpoint_name, region_name):
+    """Return a function embedding a list of texts with the SageMaker endpoint"""
+    import boto3
+
+    client = boto3.client('sagemaker-runtime', region_name=region_name)
+
+    def embed(texts):
+        vectors = []
+        for i in range(0, len(texts), EMBED_BATCH_SIZE):
+            payload = {"inputs": texts[i:i + EMBED_BATCH_SIZE]}
+            response = client.invoke_endpoint(EndpointName=endpoint_name, ContentType='application/json',
+                                              Body=json.dumps(payload).encode('utf-8'))
+            for vector in json.loads(response['Body'].read()):
+                # If nested, flatten to get the actual vector
+                if isinstance(vector, list) and len(vector) > 0 and isinstance(vector[0], list):
+                    vector = vector[0]
+                vectors.append(vector)
+        return vectors
+
+    return embed
+
+
+def embed_batch(batch, embed, field_name, vectorized_field_name):
+    """Add vectors for the documents in `batch` that have `field_name`"""
+    targets = [doc for doc in batch if doc.get(field_name)]
+    if targets:
+        for doc, vector in zip(targets, embed([doc[field_name] for doc in targets])):
+            doc[vectorized_field_name] = vector
+    return len(targets)
+
+
+def insert_batch(collection, batch, embed=None, field_name=None, vectorized_field_name=None):
+    """Embed (optionally) and insert one batch; duplicates are counted, not fatal"""
+    embedded = embed_batch(batch, embed, field_name, vectorized_field_name) if embed else 0
+    try:
+        inserted = len(collection.insert_many(batch, ordered=False).inserted_ids)
+        return {"inserted": inserted, "duplicates": 0, "errors": 0, "embedded": embedded}
+    except BulkWriteError as e:
+        write_errors = e.details.get("writeErrors", [])
+        duplicates = sum(1 for error in write_errors if error.get("code") == DUPLICATE_KEY)
+        return {"inserted": e.details.get("nInserted", 0), "duplicates": duplicates,
+                "errors": len(write_errors) - duplicates, "embedded": embedded}
+
+
+def load(collection, path, batch_size=1000, workers=4, embed=None, field_name=None,
+         vectorized_field_name=None, meta_collection=None, report_every=10000):
+    """Load `path` into `collection` and return throughput statistics"""
+    stats = {"documents": 0, "inserted": 0, "duplicates": 0, "errors": 0, "embedded": 0}
+    start = time.perf_counter()
+    next_report = report_every
+
+    def collect(futures):
+        nonlocal next_report
+        for future in futures:
+            for key, value in future.result().items():
+                stats[key] += value
+        if stats["inserted"] >= next_report:
+            elapsed = time.perf_counter() - start
+            print(f"loaded: {stats['inserted']} documents ({stats['inserted'] / elapsed:.0f} docs/sec)")
+            next_report += report_every
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        in_flight = set()
+        for batch in read_batches(path, batch_size):
+            stats["documents"] += len(batch)
+            if len(in_flight) >= workers * 2:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+            in_flight.add(executor.submit(insert_batch, collection, batch, embed,
+                                          field_name, vectorized_field_name))
+        collect(wait(in_flight).done)
+
+    if meta_collection is not None and stats["inserted"]:
+        bump_collection_version(meta_collection)
+
+    stats["seconds"] = round(time.perf_counter() - start, 3)
+    stats["docs_per_sec"] = round(stats["inserted"] / stats["seconds"], 1) if stats["seconds"] else 0.0
+    return stats
+
+
+def main():
+    import pymongo
+    from dotenv import load_dotenv
+
+    # Load environment variables from .env file
+    load_dotenv(os.path.join(os.path.dirname(__file__), '..', '.env'))
+
+    parser = argparse.ArgumentParser(description="Stream an Extended JSON lines file into MongoDB")
+    parser.add_argument("--file", default=os.path.join(os.path.dirname(__file__), "movies.json"))
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--embed", action="store_true",
+                        help="embed FIELD_NAME_TO_BE_VECTORIZED into VECTORIZED_FIELD_NAME while loading")
+    parser.add_argument("--drop", action="store_true", help="drop the collection before loading")
+    args = parser.parse_args()
+
+    mongo_collection = os.getenv("MONGO_COLLECTION")
+    db = pymongo.MongoClient(os.getenv("ATLAS_URI"))[os.getenv("MONGO_DB")]
+    collection = db[mongo_collection]
+    meta_collection = db[os.getenv("MONGO_META_COLLECTION", f"{mongo_collection}_meta")]
+    if args.drop:
+        collection.drop()
+
+    embed = None
+    if args.embed:
+        embed = sagemaker_embedder(os.getenv("EMBEDDING_ENDPOINT_NAME"), os.getenv("AWS_REGION1"))
+
+    print(f"loading {args.file} into {collection.full_name} "
+          f"(batch size {args.batch_size}, {args.workers} workers, embed={args.embed})")
+    stats = load(collection, args.file, batch_size=args.batch_size, workers=args.workers, embed=embed,
+                 field_name=os.getenv("FIELD_NAME_TO_BE_VECTORIZED"),
+                 vectorized_field_name=os.getenv("VECTORIZED_FIELD_NAME"),
+                 meta_collection=meta_collection)
+    print(f"finished: {stats['inserted']} inserted, {stats['duplicates']} duplicates, "
+          f"{stats['errors']} errors, {stats['embedded']} embedded in {stats['seconds']}s "
+          f"({stats['docs_per_sec']} docs/sec)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+Throughput of server mode (hello_world/server.py) against the per-invocation
+Lambda model, on the stubbed MongoDB and SageMaker backends of
+profile_handler.py.
+
+  lambda  --concurrency containers start together, each a fresh interpreter
+          handling its share of the requests one at a time, as Lambda would
+          for a burst; reported with and without the cold starts
+  server  one server process; --concurrency keep-alive clients send the same
+          requests, which share the chain, caches and embedding batches
+
+    python load_test_server.py --requests 400 --concurrency 16
+"""
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection
+
+from profile_handler import (CATALOGUE_SIZE, HELLO_WORLD_DIR, STUB_ENVIRONMENT, collect, install_stubs,
+                             load_catalogue, percentile, run_worker, synthetic_events)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def serve_stubbed(args):
+    """Server subprocess: the real server on stubbed backends"""
+    import asyncio
+
+    sys.path.insert(0, os.path.abspath(HELLO_WORLD_DIR))
+    import server
+
+    install_stubs(load_catalogue(args.catalogue_size, seed=args.seed), args)
+    # keep the per-request logging out of the load test output
+    sys.stdout = open(os.devnull, "w")
+    asyncio.run(server.serve("127.0.0.1", args.port))
+
+
+def start_server(args, port):
+    command = [sys.executable, os.path.abspath(__file__), "--serve", "--port", str(port),
+               "--catalogue-size", str(args.catalogue_size), "--seed", str(args.seed),
+               "--mongo-latency-ms", str(args.mongo_latency_ms),
+               "--embedding-latency-ms", str(args.embedding_latency_ms),
+               "--llm-latency-ms", str(args.llm_latency_ms)]
+    process = subprocess.Popen(command, cwd=os.path.abspath(HELLO_WORLD_DIR), stdout=subprocess.DEVNULL,
+                               env={**os.environ, **STUB_ENVIRONMENT,
+                                    "SERVER_WORKERS": str(max(args.concurrency, 1))})
+    start = time.perf_counter()
+    while time.perf_counter() - start < 60:
+        if process.poll() is not None:
+            raise RuntimeError("server exited during startup")
+        try:
+            request(HTTPConnection("127.0.0.1", port, timeout=5), "GET", "/health")
+            return process, (time.perf_counter() - start) * 1000
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("server did not start within 60s")
+
+
+def request(connection, method, path, event=None):
+    body = json.dumps(event).encode("utf-8") if event is not None else None
+    connection.request(method, path, body=body, headers={"Content-Type": "application/json"})
+    response = connection.getresponse()
+    payload = json.loads(response.read())
+    if response.status != 200:
+        raise RuntimeError(f"{method} {path} returned {response.status}: {payload}")
+    return payload
+
+
+def load_server(args, events):
+    port = free_port()
+    process, startup_ms = start_server(args, port)
+    local = threading.local()
+    latencies = []
+
+    def send(event):
+        if not hasattr(local, "connection"):
+            local.connection = HTTPConnection("127.0.0.1", port, timeout=60)
+        start = time.perf_counter()
+        request(local.connection, "POST", "/lex", event)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    try:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            list(executor.map(send, events))
+        elapsed = time.perf_counter() - start
+        health = request(HTTPConnection("127.0.0.1", port, timeout=5), "GET", "/health")
+    finally:
+        process.terminate()
+        process.wait()
+
+    return {
+        "startup_ms": round(startup_ms, 1),
+        "requests_per_sec": round(len(events) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p95_ms": round(percentile(latencies, 95), 1),
+        "embedding_batches": health["embedding_batches"],
+        "retrieval_cache": health["retrieval_cache"],
+    }
+
+
+def load_lambda(args):
+    per_container = max(args.requests // args.concurrency, 1)
+    worker_args = argparse.Namespace(**{**vars(args), "events": per_container - 1, "top": 0})
+    start = time.perf_counter()
+    containers = [collect(process) for process in
+                  [run_worker("latency", worker_args) for _ in range(args.concurrency)]]
+    elapsed = time.perf_counter() - start
+    warm_p50 = percentile([container["warm_p50_ms"] for container in containers], 50)
+    return {
+        "requests_per_sec": round(per_container * args.concurrency / elapsed, 1),
+        "warm_requests_per_sec": round(args.concurrency * 1000 / warm_p50, 1) if warm_p50 else 0.0,
+        "cold_start_p50_ms": percentile([container["cold_start_ms"] for container in containers], 50),
+        "warm_p50_ms": warm_p50,
+        "warm_p95_ms": max(container["warm_p95_ms"] for container in containers),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare server mode throughput with per-invocation Lambda")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--catalogue-size", type=int, default=CATALOGUE_SIZE, help="movies in the stub catalogue")
+    parser.add_argument("--mongo-latency-ms", type=float, default=5)
+    parser.add_argument("--embedding-latency-ms", type=float, default=30)
+    parser.add_argument("--llm-latency-ms", type=float, default=200)
+    parser.add_argument("--seed", type=int, default=1223)
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve_stubbed(args)
+        return
+
+    events = synthetic_events(load_catalogue(args.catalogue_size, seed=args.seed), args.requests, seed=args.seed)
+    results = {"lambda": load_lambda(args), "server": load_server(args, events)}
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    lam, srv = results["lambda"], results["server"]
+    batches = srv["embedding_batches"] or {}
+    print(f"{'='*80}")
+    print(f"⚡ LOAD TEST: {args.requests} requests, {args.concurrency} concurrent "
+          f"(stub latency: mongo {args.mongo_latency_ms}ms, embedding {args.embedding_latency_ms}ms, "
+          f"llm {args.llm_latency_ms}ms)")
+    print(f"{'='*80}")
+    print(f"Lambda, {args.concurrency} containers: {lam['requests_per_sec']} req/s including cold starts "
+          f"(p50 {lam['cold_start_p50_ms']}ms), {lam['warm_requests_per_sec']} req/s once warm; "
+          f"warm p50 {lam['warm_p50_ms']}ms / p95 {lam['warm_p95_ms']}ms, one embedding call per query")
+    print(f"Server, 1 process: {srv['requests_per_sec']} req/s after a {srv['startup_ms']}ms startup; "
+          f"p50 {srv['p50_ms']}ms / p95 {srv['p95_ms']}ms; "
+          f"{batches.get('batches', 0)} embedding calls for {batches.get('queries', 0)} queries "
+          f"(mean batch {batches.get('mean_batch', 0)}); retrieval cache hit rate "
+          f"{srv['retrieval_cache']['hit_rate']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,12 @@ import json
 import boto3
 import pymongo
 import os
+import sys
+
+# passage splitting is shared with the Lambda retriever
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'hello_world'))
+from passages import split_passages
+from retrieval_cache import bump_collection_version
 
 #utility 
 newline, bold, unbold = '\n', '\033[1m', '\033[0m'
@@ -17,12 +23,19 @@ print(mongo_uri)
 
 mongo_db= os.getenv("MONGO_DB")
 mongo_collection = os.getenv("MONGO_COLLECTION")
+# Holds the version token the Lambda retrieval cache is keyed on
+mongo_meta_collection = os.getenv("MONGO_META_COLLECTION", f"{mongo_collection}_meta")
 
 #MongoDB Vector Parameters
 index_name = os.getenv("MONGO_INDEX")
 field_name_to_be_vectorized=os.getenv("FIELD_NAME_TO_BE_VECTORIZED")
 vectorized_field_name = os.getenv("VECTORIZED_FIELD_NAME") 
 
+# "document" stores one vector per document; "passages" splits the field into
+# overlapping passages stored, with their vectors, in the chunks collection
+index_mode = os.getenv("INDEX_MODE", "document")
+mongo_chunk_collection = os.getenv("MONGO_CHUNK_COLLECTION") or f"{mongo_collection}_chunks"
+
 # What you want to search (Semantic Search) in the MongoDB Atlas Collection
 search_variable = os.getenv("SEARCH_VARIABLE")
 
@@ -35,6 +48,8 @@ embedding_endpoint_name=os.getenv("EMBEDDING_ENDPOINT_NAME")
 client = pymongo.MongoClient(mongo_uri)
 db = client[mongo_db]
 collection = db[mongo_collection]
+meta_collection = db[mongo_meta_collection]
+chunk_collection = db[mongo_chunk_collection]
 
 print("Collection:"+ str(collection))
       
@@ -57,7 +72,18 @@ def parse_response_multiple_texts(query_response):
     model_predictions = json.loads(query_response['Body'].read())
     return model_predictions
 
+def flatten_vector(vector):
+    if isinstance(vector, list) and len(vector) > 0 and isinstance(vector[0], list):
+        # If nested, flatten to get the actual vector
+        vector = vector[0]
+    return vector
+
+if index_mode == "passages":
+    chunk_collection.create_index('parent_id')
+    print("Writing passages to: " + mongo_chunk_collection)
+
 i = 0
+passage_count = 0
 # Loop over all documents
 for document in documents:
 
@@ -66,17 +92,28 @@ for document in documents:
 
  ##########################################################################
  # This code to be used if the schema is flat    
-    if field_name_to_be_vectorized in document:
+    if field_name_to_be_vectorized in document and index_mode == "passages":
+        passages = split_passages(document[field_name_to_be_vectorized])
+        chunk_collection.delete_many({'parent_id': document['_id']})
+        if passages:
+            payload = {"inputs": passages}
+            query_response = query_endpoint_with_json_payload(json.dumps(payload).encode('utf-8'))
+            embeddings = parse_response_multiple_texts(query_response)
+            chunk_collection.insert_many([
+                {'parent_id': document['_id'], 'chunk_index': n, 'text': passage,
+                 vectorized_field_name: flatten_vector(vector)}
+                for n, (passage, vector) in enumerate(zip(passages, embeddings))
+            ])
+            passage_count += len(passages)
+
+    elif field_name_to_be_vectorized in document:
         payload = {"inputs": [document[field_name_to_be_vectorized]]}
         query_response = query_endpoint_with_json_payload(json.dumps(payload).encode('utf-8'))
         embeddings = parse_response_multiple_texts(query_response)
         # print("embeddings: " + str(embeddings[0]))
 
         # Flatten the embedding to ensure it's a simple array
-        vector = embeddings[0]
-        if isinstance(vector, list) and len(vector) > 0 and isinstance(vector[0], list):
-            # If nested, flatten to get the actual vector
-            vector = vector[0]
+        vector = flatten_vector(embeddings[0])
         
         # update the document
         update = {'$set': {vectorized_field_name : vector}}
@@ -88,6 +125,10 @@ for document in documents:
 ##########################################################################
 
 print("finished processing: " + str(i) + " records")
+# one bump for the whole run, like the other writers
+bump_collection_version(meta_collection)
+if index_mode == "passages":
+    print("wrote " + str(passage_count) + " passages, " + str(round(passage_count / max(i, 1), 2)) + " per record")
 
 print(newline + bold+ "Vector index to be created manually. Please ensure vector search index ~ " + index_name + "  ~ is created in MongoDB Atlas "+ unbold + newline)
 
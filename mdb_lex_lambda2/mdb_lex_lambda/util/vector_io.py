@@ -0,0 +1,199 @@
+"""
+Bulk export and import of embedding vectors.
+
+Vectors move as contiguous float32 buffers rather than per-document Python
+lists:
+
+  export  streams _id + VECTORIZED_FIELD_NAME (projection only) into either
+          a .npy file (memory-mapped while writing) with an .ids.jsonl
+          sidecar, or a .parquet file with a fixed-size float32 list column
+  import  bulk-writes the vectors back with unordered UpdateOne batches,
+          optionally as BSON float32 vectors (binData subtype 9)
+
+    python vector_io.py export --out vectors.npy
+    python vector_io.py import --in vectors.parquet --binary
+
+pyarrow is only needed for .parquet files.
+"""
+
+import warnings
+warnings.filterwarnings('ignore', category=RuntimeWarning)
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from bson import json_util
+from bson.binary import VECTOR_SUBTYPE, Binary, BinaryVectorDtype
+from pymongo import UpdateOne
+
+# the version token is shared with the Lambda retriever
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'hello_world'))
+from retrieval_cache import bump_collection_version
+
+BATCH_SIZE = 1000
+# Header of a BSON float32 vector: dtype byte, then padding byte
+FLOAT32_VECTOR_HEADER = BinaryVectorDtype.FLOAT32.value + b"\x00"
+
+
+def ids_path(npy_path):
+    """Sidecar holding one Extended JSON _id per row of the .npy file"""
+    return os.path.splitext(npy_path)[0] + ".ids.jsonl"
+
+
+def as_float32(vector):
+    """View a stored vector (list or BSON float32 vector) as a float32 array"""
+    if isinstance(vector, Binary) and vector.subtype == VECTOR_SUBTYPE:
+        if vector[:1] != BinaryVectorDtype.FLOAT32.value:
+            raise ValueError("only float32 BSON vectors are supported")
+        return np.frombuffer(vector, dtype=np.float32, offset=2)
+    return np.asarray(vector, dtype=np.float32)
+
+
+def to_bson_vector(row):
+    return Binary(FLOAT32_VECTOR_HEADER + np.ascontiguousarray(row, dtype=np.float32).tobytes(), VECTOR_SUBTYPE)
+
+
+def iter_vector_batches(collection, field, batch_size=BATCH_SIZE):
+    """Yield (ids, float32 matrix) batches for documents that have `field`"""
+    cursor = collection.find({field: {"$exists": True}}, {"_id": 1, field: 1}).batch_size(batch_size)
+    ids, rows = [], []
+    for document in cursor:
+        ids.append(document["_id"])
+        rows.append(as_float32(document[field]))
+        if len(ids) == batch_size:
+            yield ids, np.stack(rows)
+            ids, rows = [], []
+    if ids:
+        yield ids, np.stack(rows)
+
+
+def export_npy(collection, field, path, batch_size=BATCH_SIZE):
+    expected = collection.count_documents({field: {"$exists": True}})
+    matrix = None
+    written = 0
+    with open(ids_path(path), "w") as ids_file:
+        for ids, rows in iter_vector_batches(collection, field, batch_size):
+            if matrix is None:
+                matrix = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32,
+                                                   shape=(expected, rows.shape[1]))
+            # documents added since the count are left for the next export
+            rows = rows[:expected - written]
+            ids = ids[:len(rows)]
+            matrix[written:written + len(rows)] = rows
+            ids_file.writelines(json_util.dumps(doc_id) + "\n" for doc_id in ids)
+            written += len(rows)
+            if written == expected:
+                break
+    if matrix is None:
+        np.save(path, np.empty((0, 0), dtype=np.float32))
+        return 0
+    matrix.flush()
+    if written < expected:
+        # documents removed since the count: rewrite without the unused rows
+        trimmed = np.array(matrix[:written])
+        del matrix
+        np.save(path, trimmed)
+    return written
+
+
+def export_parquet(collection, field, path, batch_size=BATCH_SIZE):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    written = 0
+    for ids, rows in iter_vector_batches(collection, field, batch_size):
+        dimensions = rows.shape[1]
+        vectors = pa.FixedSizeListArray.from_arrays(pa.array(rows.reshape(-1)), dimensions)
+        table = pa.table({"_id": [json_util.dumps(doc_id) for doc_id in ids], field: vectors})
+        if writer is None:
+            writer = pq.ParquetWriter(path, table.schema)
+        writer.write_table(table)
+        written += len(ids)
+    if writer is not None:
+        writer.close()
+    return written
+
+
+def read_npy(path, batch_size=BATCH_SIZE):
+    """Yield (ids, float32 matrix) batches from a .npy file and its id sidecar"""
+    matrix = np.load(path, mmap_mode="r")
+    with open(ids_path(path)) as ids_file:
+        for start in range(0, len(matrix), batch_size):
+            rows = matrix[start:start + batch_size]
+            ids = [json_util.loads(next(ids_file)) for _ in range(len(rows))]
+            yield ids, rows
+
+
+def read_parquet(path, field, batch_size=BATCH_SIZE):
+    import pyarrow.parquet as pq
+
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size):
+        vectors = batch.column(field)
+        rows = vectors.values.to_numpy(zero_copy_only=False).reshape(len(vectors), vectors.type.list_size)
+        yield [json_util.loads(doc_id) for doc_id in batch.column("_id").to_pylist()], rows
+
+
+def import_vectors(collection, field, batches, binary=False):
+    """Write vectors back by _id with unordered bulk writes"""
+    matched = 0
+    for ids, rows in batches:
+        requests = [
+            UpdateOne({"_id": doc_id}, {"$set": {field: to_bson_vector(row) if binary else row.tolist()}})
+            for doc_id, row in zip(ids, rows)
+        ]
+        if requests:
+            matched += collection.bulk_write(requests, ordered=False).matched_count
+    return matched
+
+
+def export_vectors(collection, field, path, batch_size=BATCH_SIZE):
+    if path.endswith(".parquet"):
+        return export_parquet(collection, field, path, batch_size)
+    return export_npy(collection, field, path, batch_size)
+
+
+def read_vectors(path, field, batch_size=BATCH_SIZE):
+    if path.endswith(".parquet"):
+        return read_parquet(path, field, batch_size)
+    return read_npy(path, batch_size)
+
+
+def main():
+    import pymongo
+    from dotenv import load_dotenv
+
+    # Load environment variables from .env file
+    load_dotenv(os.path.join(os.path.dirname(__file__), '..', '.env'))
+
+    parser = argparse.ArgumentParser(description="Export or import embedding vectors")
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("--out", help="export target: .npy or .parquet")
+    parser.add_argument("--in", dest="source", help="import source: .npy or .parquet")
+    parser.add_argument("--field", default=os.getenv("VECTORIZED_FIELD_NAME"))
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--binary", action="store_true", help="store vectors as BSON float32 vectors")
+    args = parser.parse_args()
+
+    mongo_collection = os.getenv("MONGO_COLLECTION")
+    db = pymongo.MongoClient(os.getenv("ATLAS_URI"))[os.getenv("MONGO_DB")]
+    collection = db[mongo_collection]
+
+    start = time.perf_counter()
+    if args.command == "export":
+        count = export_vectors(collection, args.field, args.out, args.batch_size)
+        print(f"exported {count} vectors to {args.out}")
+    else:
+        count = import_vectors(collection, args.field, read_vectors(args.source, args.field, args.batch_size),
+                               binary=args.binary)
+        bump_collection_version(db[os.getenv("MONGO_META_COLLECTION", f"{mongo_collection}_meta")])
+        print(f"imported {count} vectors from {args.source}")
+    elapsed = time.perf_counter() - start
+    print(f"{elapsed:.2f}s ({count / elapsed:.0f} vectors/sec)")
+
+
+if __name__ == "__main__":
+    main()